@@ -0,0 +1,78 @@
+"""
+Benchmark and accuracy check of the reduced-precision (dtype=np.float32) path of
+area_mean, area_mean_nemo and seaice_areas against the float64 path.
+
+Run with e.g.
+python examples/benchmark_precision.py
+"""
+
+import time
+import numpy as np
+import xarray as xr
+from focitools.area_averages_and_integrals import area_mean, area_mean_nemo, seaice_areas
+
+
+def compare_precision(func, *args, dtype=np.float32, **kwargs):
+    """
+    Time func with and without dtype, and compare the results.
+    The reference is func with all float inputs cast to float64, since the default
+    path keeps float32 inputs (e.g. from read_nemo) in float32 in some steps.
+
+    Input
+    -----
+    func - area_mean, area_mean_nemo or seaice_areas
+    *args, **kwargs - Arguments to func, e.g. data, mask, cell_area
+    dtype (optional) - Reduced precision to test (default: np.float32)
+
+    Output
+    ------
+    result - Dictionary with
+             time_float64, time_reduced - Wall time (s) of each path, including reading data
+             max_rel_error - Largest error relative to the largest float64 value,
+                             for each variable if func returns a Dataset
+    """
+
+    def _float64(x):
+        if isinstance(x, xr.Dataset) or (isinstance(x, xr.DataArray) and x.dtype.kind == 'f'):
+            return x.astype(np.float64)
+        return x
+
+    t0 = time.perf_counter()
+    ref = func(*[_float64(a) for a in args], **kwargs).compute()
+    t1 = time.perf_counter()
+    low = func(*args, dtype=dtype, **kwargs).compute()
+    t2 = time.perf_counter()
+
+    def _error(a, b):
+        return float(abs(b.astype(np.float64) - a).max() / abs(a).max())
+
+    if isinstance(ref, xr.Dataset):
+        error = {v: _error(ref[v], low[v]) for v in ref.data_vars}
+    else:
+        error = _error(ref, low)
+
+    return {'time_float64': t1 - t0, 'time_reduced': t2 - t1, 'max_rel_error': error}
+
+
+if __name__ == '__main__':
+
+    # eORCA1-sized field, 10 years of monthly data
+    nt, ny, nx = 120, 332, 362
+    rng = np.random.default_rng(0)
+    lat = np.repeat(np.linspace(-80, 89, ny)[:, None], nx, axis=1)
+
+    sst = xr.DataArray((280 + 20 * rng.random((nt, ny, nx))).astype(np.float32),
+                       dims=('time', 'y', 'x')).chunk({'time': 12})
+    sic = xr.Dataset({'ileadfra': (('time', 'y', 'x'), rng.random((nt, ny, nx)).astype(np.float32))},
+                     coords={'nav_lat': (('y', 'x'), lat)}).chunk({'time': 12})
+    mask = xr.DataArray((rng.random((ny, nx)) > 0.3).astype(np.int8), dims=('y', 'x'))
+    areacello = xr.DataArray((1e9 * (1 + rng.random((ny, nx)))).astype(np.float32), dims=('y', 'x'))
+
+    grid = xr.DataArray(sst.values, dims=('time', 'lat', 'lon'),
+                        coords={'lat': np.linspace(-89.5, 89.5, ny),
+                                'lon': np.linspace(0, 359, nx)}).chunk({'time': 12})
+
+    for name, func, args in [('area_mean', area_mean, (grid,)),
+                             ('area_mean_nemo', area_mean_nemo, (sst, mask, areacello)),
+                             ('seaice_areas', seaice_areas, (sic, areacello, mask))]:
+        print(name, compare_precision(func, *args))
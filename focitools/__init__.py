@@ -10,4 +10,17 @@ from .read_echam import *
 from .read_nemo_mesh import *
 from .read_nemo import * 
 from .functions import *
-from .area_averages_and_integrals import * 
\ No newline at end of file
+from .area_averages_and_integrals import *
+from .regrid import *
+from .streaming import *
+from .analysis_store import *
+from .regions import *
+from .stations import *
+from .composites import *
+from .planner import *
+from .graph_checks import *
+from .agrif import *
+from .column_search import *
+from .quantiles import *
+from .vertical_integrals import *
+from .regression import *
\ No newline at end of file
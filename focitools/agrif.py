@@ -0,0 +1,202 @@
+import numpy as np
+import xarray as xr
+
+
+def read_nemo_agrif(exp_list, time_list, esm_dir, nests=['1_'], grid='grid_T', freq='1m', **kwargs):
+    """
+    Read NEMO output from the parent grid and AGRIF nests, e.g. INALT or VIKING.
+    All grids are opened at the same time in separate threads.
+
+    Input
+    -----
+    exp_list - List of experiment IDs
+    time_list - List of time slices to read
+    esm_dir - Directory to experiments
+    nests (optional) - Prefixes of the nests (default: ['1_'])
+    grid (optional) - e.g. grid_T, icemod. Default: grid_T
+    freq (optional) - e.g. 1m, 5d. Default: 1m
+    **kwargs - Passed on to read_nemo, e.g. store_dir, aggregate
+
+    Output
+    ------
+    ds_all - List with one list [parent, nest1, ...] of Datasets for each experiment
+    """
+
+    from concurrent.futures import ThreadPoolExecutor
+    from focitools.read_nemo import read_nemo
+
+    prefixes = [''] + list(nests)
+
+    def _read(prefix):
+        return read_nemo(exp_list, time_list, esm_dir, grid=grid, freq=freq,
+                         agrif_prefix=prefix, **kwargs)
+
+    with ThreadPoolExecutor(max_workers=len(prefixes)) as pool:
+        ds_grids = list(pool.map(_read, prefixes))
+
+    # one list of grids for each experiment
+    return [list(ds_exp) for ds_exp in zip(*ds_grids)]
+
+
+def read_agrif_fixed_grids(filename):
+    """
+    Read the position of AGRIF nests in the parent grid from AGRIF_FixedGrids.in
+
+    The file has the number of nests of the parent, then one line per nest with
+    imin imax jmin jmax rx ry rt, then the number of nests of each nest.
+
+    Input
+    -----
+    filename - Path to AGRIF_FixedGrids.in
+
+    Output
+    ------
+    nests - List with one dictionary per nest with imin, imax, jmin, jmax
+            (Fortran indices in the parent grid) and refinement factors rx, ry
+    """
+
+    with open(filename) as f:
+        lines = [line.split() for line in f if line.strip()]
+
+    nnest = int(lines[0][0])
+    nests = []
+    for line in lines[1:nnest+1]:
+        imin, imax, jmin, jmax, rx, ry = [int(v) for v in line[:6]]
+        nests.append({'imin': imin, 'imax': imax, 'jmin': jmin, 'jmax': jmax, 'rx': rx, 'ry': ry})
+
+    for line in lines[nnest+1:2*nnest+1]:
+        if int(line[0]) != 0:
+            raise ValueError('Only nests of the parent grid are supported, not nests within nests')
+
+    return nests
+
+
+def agrif_masks(mesh_list, fixed_grids, nbghostcells=None, x_name='x', y_name='y'):
+    """
+    Compute masks so that each part of the ocean is only counted once
+    when parent and nests are combined.
+
+    The footprint of each nest in the parent grid is taken from AGRIF_FixedGrids.in.
+    Nest boundaries are on parent U and V points, so the nest covers the parent
+    T cells imin+1 to imax and jmin+1 to jmax (Fortran indices), which are excluded.
+    Each nest has (imax - imin) * rx interior columns (and the same for rows),
+    surrounded by nbghostcells ghost cells and one boundary cell on each side,
+    which overlap the parent and are excluded from the nest.
+
+    Input
+    -----
+    mesh_list - List of mesh datasets [parent, nest1, ...] from read_nemo_mesh
+    fixed_grids - Path to AGRIF_FixedGrids.in, or output from read_agrif_fixed_grids
+    nbghostcells (optional) - Number of ghost cells in NEMO (nbghostcells in par_oce.F90).
+                              Default: from the size of the nest meshes
+    x_name (optional) - Name of x dimension (default: x)
+    y_name (optional) - Name of y dimension (default: y)
+
+    Output
+    ------
+    masks - List of DataArrays [parent, nest1, ...], 1 where the grid point is used
+    """
+
+    if not isinstance(fixed_grids, (list, tuple)):
+        fixed_grids = read_agrif_fixed_grids(fixed_grids)
+
+    if len(fixed_grids) != len(mesh_list) - 1:
+        raise ValueError('%d nests in fixed_grids, but %d nest meshes' %
+                         (len(fixed_grids), len(mesh_list) - 1))
+
+    parent = mesh_list[0]
+    covered = np.zeros((parent.sizes[y_name], parent.sizes[x_name]), dtype=bool)
+
+    masks = []
+    for mesh, nest in zip(mesh_list[1:], fixed_grids):
+
+        # parent T cells imin+1..imax (Fortran), i.e. imin..imax-1 from 0
+        covered[nest['jmin']:nest['jmax'], nest['imin']:nest['imax']] = True
+
+        # interior of nest
+        nx = (nest['imax'] - nest['imin']) * nest['rx']
+        ny = (nest['jmax'] - nest['jmin']) * nest['ry']
+        halo_x = (mesh.sizes[x_name] - nx) // 2
+        halo_y = (mesh.sizes[y_name] - ny) // 2
+        if nbghostcells is not None:
+            halo = nbghostcells + 1
+            if mesh.sizes[x_name] != nx + 2 * halo or mesh.sizes[y_name] != ny + 2 * halo:
+                raise ValueError('Nest mesh is %d x %d, but fixed_grids and nbghostcells=%d give %d x %d' %
+                                 (mesh.sizes[x_name], mesh.sizes[y_name], nbghostcells,
+                                  nx + 2 * halo, ny + 2 * halo))
+            halo_x = halo_y = halo
+        elif halo_x < 1 or halo_y < 1 or halo_x != halo_y or (mesh.sizes[x_name] - nx) % 2:
+            raise ValueError('Nest mesh (%d x %d) does not match fixed_grids (%d x %d interior cells)' %
+                             (mesh.sizes[x_name], mesh.sizes[y_name], nx, ny))
+
+        interior = np.zeros((mesh.sizes[y_name], mesh.sizes[x_name]), dtype=np.int8)
+        interior[halo_y:halo_y+ny, halo_x:halo_x+nx] = 1
+        masks.append(xr.DataArray(interior, dims=(y_name, x_name)))
+
+    parent_mask = xr.DataArray((~covered).astype(np.int8), dims=(y_name, x_name))
+
+    return [parent_mask] + masks
+
+
+def agrif_integral(data_list, mesh_list, masks=None, fixed_grids=None, kind='area', mean=False,
+                   x_name='x', y_name='y', z_name='deptht'):
+    """
+    Area or volume integral (or mean) over the parent and nests combined.
+
+    Each grid is weighted by cell area (or volume), ocean mask and the masks
+    from agrif_masks, so the nest footprint is not counted twice.
+    The sums over all grids are added lazily, so they are computed together
+    in one pass.
+
+    Input
+    -----
+    data_list - List of DataArrays [parent, nest1, ...], e.g. from read_nemo_agrif
+    mesh_list - List of mesh datasets [parent, nest1, ...] from read_nemo_mesh
+    masks (optional) - Output from agrif_masks. Default: computed from mesh_list and fixed_grids
+    fixed_grids (optional) - Path to AGRIF_FixedGrids.in, needed if masks is not given
+    kind (optional) - 'area' for 2D fields (default) or 'volume' for 3D fields
+    mean (optional) - Return mean instead of integral (default: False)
+    x_name, y_name, z_name (optional) - Dimension names (default: x, y, deptht)
+
+    Output
+    ------
+    integral - DataArray with integral (or mean) over all grids
+
+    Example
+    -------
+    ds_grids = read_nemo_agrif(['INALT20_EXP'], [slice(None)], esm_dir)[0]
+    meshes = [read_nemo_mesh(f) for f in ['mesh_mask.nc', '1_mesh_mask.nc']]
+    sst_mean = agrif_integral([ds['sosstsst'] for ds in ds_grids], meshes,
+                              fixed_grids='AGRIF_FixedGrids.in', mean=True)
+    """
+
+    if masks is None:
+        if fixed_grids is None:
+            raise ValueError('Give masks from agrif_masks, or fixed_grids')
+        masks = agrif_masks(mesh_list, fixed_grids, x_name=x_name, y_name=y_name)
+
+    if kind == 'area':
+        dims = [x_name, y_name]
+    elif kind == 'volume':
+        dims = [x_name, y_name, z_name]
+    else:
+        raise ValueError("kind must be 'area' or 'volume', not %s" % (kind,))
+
+    total = 0
+    weight = 0
+    for data, mesh, mask in zip(data_list, mesh_list, masks):
+
+        if kind == 'area':
+            w = mesh['areacello'] * mesh['tmask'].isel({z_name: 0}, drop=True)
+        else:
+            w = mesh['volcello'] * mesh['tmask']
+        w = (w * mask).fillna(0)
+
+        total = total + xr.dot(data.fillna(0), w, dim=dims)
+        if mean:
+            weight = weight + xr.dot(data.notnull(), w, dim=dims)
+
+    if mean:
+        return total / weight
+
+    return total
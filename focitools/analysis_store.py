@@ -0,0 +1,242 @@
+import os
+import json
+import numpy as np
+import xarray as xr
+from focitools import functions
+
+# Names of horizontal dimensions on NEMO, OpenIFS and ECHAM grids
+_horizontal_dims = ['y', 'x', 'lat', 'lon']
+
+# Encoding from netCDF files that should not be passed on to zarr
+_drop_encoding = ['chunksizes', 'zlib', 'complevel', 'shuffle', 'contiguous', 'fletcher32',
+                  'source', 'original_shape', 'preferred_chunks', 'chunks',
+                  'compressor', 'compressors', 'filters', 'szip', 'zstd', 'bzip2', 'blosc',
+                  'endian', 'least_significant_digit', 'quantize_mode', 'significant_digits']
+
+
+def analysis_store_path(store_dir, exp, model, grid, freq):
+    """
+    Path to the analysis store for one experiment, model, grid and frequency
+    e.g. store_dir/FOCI_GJK029_nemo_1m_grid_T.zarr
+    """
+    return os.path.join(store_dir, '%s_%s_%s_%s.zarr' % (exp, model, freq, grid))
+
+
+def _store_chunks(ds, strategy, time_name, target_bytes):
+    """
+    Work out zarr chunks for a chunking strategy.
+
+    'time' - all time steps in one chunk, horizontal dims split into tiles
+             so that each chunk is about target_bytes. Fast to read time series
+             at a point or small region.
+    'space' - one time step per chunk, horizontal dims not split.
+              Fast to read maps.
+    """
+
+    if isinstance(strategy, dict):
+        return strategy
+
+    if strategy == 'space':
+        return {time_name: 1}
+
+    if strategy != 'time':
+        raise ValueError("strategy must be 'time', 'space' or a dictionary of chunks, not %s" % (strategy,))
+
+    # bytes of one time series for all non-horizontal dims (e.g. all depths) for the largest variable
+    hdims = [d for d in _horizontal_dims if d in ds.dims]
+    column_bytes = 1
+    for v in ds.data_vars.values():
+        if time_name in v.dims:
+            n = v.dtype.itemsize
+            for d in v.dims:
+                if d not in hdims:
+                    n *= v.sizes[d]
+            column_bytes = max(column_bytes, n)
+
+    # square tiles in the horizontal
+    npoints = max(int(target_bytes // column_bytes), 1)
+    tile = max(int(np.sqrt(npoints)), 1)
+
+    chunks = {time_name: -1}
+    for d in hdims:
+        chunks[d] = min(tile, ds.sizes[d])
+
+    return chunks
+
+
+def _clean_encoding(ds):
+    """
+    Remove netCDF encoding (compression, chunks) so that zarr chunks are used
+    """
+
+    ds = ds.copy()
+    for v in ds.variables.values():
+        for key in _drop_encoding:
+            v.encoding.pop(key, None)
+
+    return ds
+
+
+def write_analysis_store(ds, store, source_files=None, strategy='time', max_bytes=2e9,
+                         target_chunk_bytes=64e6, time_name='time_counter'):
+    """
+    Write an experiment to a Zarr "analysis store", rechunked for fast access.
+
+    FOCI output is one file per time block, so reading a long time series at a point
+    means reading all files. With strategy='time', the store has all time steps
+    in each chunk, so time series at a point or region are read from a few chunks.
+
+    Data is written in blocks, so no more than about max_bytes is held in memory.
+    Note that with strategy='time' each block is a band of rows from all time steps,
+    so every source file is read (and decompressed) once per block, 
+    and the total I/O grows with the number of blocks. Use a larger max_bytes 
+    to reduce the number of blocks. 
+    The modification times of the source files are stored, so that readers
+    (read_nemo, read_openifs with store_dir) only use the store when it is up to date.
+
+    Input
+    -----
+    ds - xarray.Dataset, e.g. from functions.open_multifile_dataset
+    store - Path to zarr store
+    source_files (optional) - Files (or pattern) ds was read from
+    strategy (optional) - 'time' (default) for time series, 'space' for maps,
+                          or a dictionary with chunks for each dimension
+    max_bytes (optional) - Max bytes to hold in memory when writing (default: 2 GB)
+    target_chunk_bytes (optional) - Size of chunks for strategy='time' (default: 64 MB)
+    time_name (optional) - Name of time dimension (default: time_counter)
+
+    Output
+    ------
+    store - Path to zarr store
+    """
+
+    import zarr
+
+    chunks = _store_chunks(ds, strategy, time_name, target_chunk_bytes)
+
+    # Dimension to stream over. We write a block of this dimension at a time
+    # For time series chunks, we stream over the outermost horizontal dimension
+    if chunks.get(time_name, 1) == -1 or chunks.get(time_name, 1) >= ds.sizes[time_name]:
+        stream_dim = [d for d in _horizontal_dims if d in ds.dims][0]
+    else:
+        stream_dim = time_name
+
+    ds = _clean_encoding(ds)
+
+    # variables without the stream dimension are small (e.g. nav_lon, time bounds)
+    # so we write them with the metadata. They must be numpy arrays (not dask), 
+    # since to_zarr with compute=False only writes numpy arrays
+    static = [v for v in ds.variables if stream_dim not in ds[v].dims]
+
+    # Write metadata and static variables
+    ds = ds.chunk(chunks)
+    for v in static:
+        ds.variables[v].load()
+    attrs = {'focitools_strategy': json.dumps(chunks),
+             'focitools_source': json.dumps(functions.files_signature(source_files) if source_files else {}),
+             'focitools_complete': 0}
+    ds.attrs.update(attrs)
+    print(' Write analysis store : ')
+    print(store)
+    ds.to_zarr(store, mode='w', compute=False, consolidated=False)
+
+    # Size of each block, in multiples of the chunk size
+    chunk = ds.chunksizes[stream_dim][0]
+    bytes_per_step = max(ds.nbytes / ds.sizes[stream_dim], 1)
+    nblock = max(int(max_bytes // (bytes_per_step * chunk)), 1) * chunk
+
+    # Write one block at a time
+    stream_vars = [v for v in ds.variables if v not in static]
+    for start in range(0, ds.sizes[stream_dim], nblock):
+        region = {stream_dim: slice(start, min(start + nblock, ds.sizes[stream_dim]))}
+        block = ds[stream_vars].isel(region).load()
+        block.drop_vars([v for v in block.coords if v in static]).to_zarr(store, region=region, consolidated=False)
+
+    # Mark store as complete
+    group = zarr.open_group(store, mode='a')
+    group.attrs['focitools_complete'] = 1
+    zarr.consolidate_metadata(store)
+
+    return store
+
+
+def open_analysis_store(store, source_files=None):
+    """
+    Open an analysis store if it exists, is complete, and is up to date.
+
+    Input
+    -----
+    store - Path to zarr store
+    source_files (optional) - Files (or pattern) the store was written from.
+                              If given, the store is only used if the files and
+                              their modification times are the same as when
+                              the store was written.
+
+    Output
+    ------
+    ds - xarray.Dataset, or None if store can not be used
+    """
+
+    if not os.path.exists(store):
+        return None
+
+    # decode time with cftime, as for netCDF files (see open_multifile_dataset)
+    ds = xr.open_zarr(store, use_cftime=True)
+
+    if not ds.attrs.get('focitools_complete', 0):
+        print(' Analysis store is incomplete, will not use it: %s' % (store,))
+        return None
+
+    if source_files is not None:
+        signature = json.loads(ds.attrs.get('focitools_source', '{}'))
+        if signature != functions.files_signature(source_files):
+            print(' Analysis store is out of date, will not use it: %s' % (store,))
+            return None
+
+    print(' Use analysis store : ')
+    print(store)
+
+    return ds
+
+
+def convert_to_analysis_store(exp, esm_dir, store_dir, model='nemo', grid='grid_T', freq='1m',
+                              strategy='time', max_bytes=2e9, target_chunk_bytes=64e6, agrif_prefix=''):
+    """
+    Convert output from an experiment to an analysis store.
+    The store can then be used by read_nemo / read_openifs with store_dir.
+
+    Input
+    -----
+    exp - Experiment ID, e.g. FOCI_GJK029
+    esm_dir - Directory to experiments (usually named esm_experiments)
+    store_dir - Directory for analysis stores
+    model (optional) - 'nemo' (default) or 'oifs'
+    grid (optional) - e.g. grid_T, regular_sfc. Default: grid_T
+    freq (optional) - e.g. 1m, 5d, 1y. Default: 1m
+    strategy (optional) - 'time' (default), 'space', or dictionary with chunks
+    max_bytes (optional) - Max bytes to hold in memory when writing (default: 2 GB)
+    target_chunk_bytes (optional) - Size of chunks for strategy='time' (default: 64 MB)
+    agrif_prefix (optional) - Prefix for AGRIF files (NEMO only)
+
+    Output
+    ------
+    store - Path to zarr store
+    """
+
+    if model == 'nemo':
+        from focitools.read_nemo import nemo_files
+        files = nemo_files(exp, esm_dir, grid=grid, freq=freq, agrif_prefix=agrif_prefix)
+        store = analysis_store_path(store_dir, exp, model, agrif_prefix + grid, freq)
+    elif model == 'oifs':
+        from focitools.read_openifs import openifs_files
+        files = openifs_files(exp, esm_dir, grid=grid, freq=freq)
+        store = analysis_store_path(store_dir, exp, model, grid, freq)
+    else:
+        raise ValueError("model must be 'nemo' or 'oifs', not %s" % (model,))
+
+    # open with one file per chunk, so that blocks are read file by file
+    file_list = functions.resolve_files(files)
+    ds = functions.open_multifile_dataset(file_list, chunks={})
+
+    return write_analysis_store(ds, store, source_files=files, strategy=strategy, max_bytes=max_bytes, 
+                                target_chunk_bytes=target_chunk_bytes)
@@ -1,7 +1,79 @@
 import numpy as np
 import xarray as xr
+from focitools.read_nemo_mesh import vvl_scale_factor
+from focitools import graph_checks
 
-def area_mean(data, lon_name='lon', lat_name='lat'):
+
+def _pairwise_sum(x, axis, keepdims=False, dtype=np.float32):
+    """
+    Sum numpy array x over axis in dtype. 
+    The axes are moved last and flattened, so numpy uses pairwise summation 
+    (error grows as log(n) rather than n)
+    """
+    
+    axis = tuple(np.atleast_1d(axis) % x.ndim)
+    keep = [i for i in range(x.ndim) if i not in axis]
+    n = int(np.prod([x.shape[i] for i in axis]))
+    
+    xt = np.ascontiguousarray(np.transpose(x, keep + list(axis)), dtype=dtype)
+    total = xt.reshape([x.shape[i] for i in keep] + [n]).sum(axis=-1, dtype=dtype)
+    
+    if keepdims:
+        total = np.expand_dims(total, axis)
+    
+    return total
+
+
+def _sum_partials(x, axis, keepdims=False, dtype=np.float32):
+    """
+    Add sums from each chunk. There are few of these, so they are added in float64
+    """
+    
+    return np.sum(x, axis=axis, keepdims=keepdims, dtype=np.float64).astype(dtype)
+
+
+def _lowprec_sum(data, dims, dtype=np.float32):
+    """
+    Sum a DataArray over dims without making float64 temporaries. 
+    Each chunk is summed pairwise in dtype, and the chunk sums are added in float64. 
+    """
+    
+    import dask.array as da
+    from functools import partial
+    
+    axis = tuple(data.get_axis_num(d) for d in dims)
+    arr = data.data
+    
+    if isinstance(arr, da.Array):
+        total = da.reduction(arr, chunk=partial(_pairwise_sum, dtype=dtype), 
+                             combine=partial(_sum_partials, dtype=dtype), 
+                             aggregate=partial(_sum_partials, dtype=dtype), 
+                             axis=axis, dtype=dtype, concatenate=True)
+    else:
+        total = _pairwise_sum(np.asarray(arr), axis, dtype=dtype)
+    
+    out_dims = [d for d in data.dims if d not in dims]
+    coords = {c: data[c] for c in data.coords if set(data[c].dims).issubset(out_dims)}
+    
+    return xr.DataArray(total, dims=out_dims, coords=coords)
+
+
+def _lowprec_weighted_mean(data, weights, dims, dtype=np.float32):
+    """
+    Weighted mean as in .weighted(weights).mean(dims), but keeping data, 
+    masks and products in dtype
+    """
+    
+    data = data.astype(dtype)
+    weights = weights.fillna(0).astype(dtype)
+    
+    total = _lowprec_sum((data * weights).fillna(0), dims, dtype=dtype)
+    wgt = _lowprec_sum(weights.where(data.notnull(), 0), dims, dtype=dtype)
+    
+    return total / wgt
+
+
+def area_mean(data, lon_name='lon', lat_name='lat', dtype=None):
     """
     Compute area average for data on a lon/lat grid. 
     Designed for OpenIFS and ECHAM, but should work for any
@@ -12,6 +84,9 @@ def area_mean(data, lon_name='lon', lat_name='lat'):
 
     lon_name (optional) - name of lon dimension, default: lon
     lat_name (optional) - name of lat dimension, default: lat
+    dtype (optional) - e.g. np.float32 to keep data, weights and products in single precision. 
+                       Sums are pairwise in each chunk, so they stay accurate. 
+                       Default: None, i.e. xarray's weighted mean (float64)
     
     Output: 
     data_mean - DataArray with area-weighted average
@@ -31,13 +106,16 @@ def area_mean(data, lon_name='lon', lat_name='lat'):
     weights = np.cos(data_sorted.lat)
     weights.name = "weights"
 
+    if dtype is not None:
+        return _lowprec_weighted_mean(data_sorted, weights, (lon_name, lat_name), dtype=dtype)
+    
     # add weights to data and compute mean
     data_wgt = data_sorted.weighted(weights)
     data_mean = data_wgt.mean((lon_name, lat_name))
     
     return data_mean
 
-def area_mean_nemo(data, mask, cell_area, x_name='x', y_name='y'):
+def area_mean_nemo(data, mask, cell_area, x_name='x', y_name='y', dtype=None):
     """
     Compute area average for NEMO data
 
@@ -48,11 +126,18 @@ def area_mean_nemo(data, mask, cell_area, x_name='x', y_name='y'):
 
     x_name (optional) - name of x dimension (default: x)
     y_name (optional) - name of y dimension (default: y)
+    dtype (optional) - e.g. np.float32 to keep data, mask and products in single precision
+                       (see area_mean). Default: None (float64)
 
     Output
     data_mean - area mean over x and y
     """
     
+    data = graph_checks.maybe_preflight(data)
+    
+    if dtype is not None:
+        return _lowprec_weighted_mean(data.where(mask == 1), cell_area, (x_name, y_name), dtype=dtype)
+    
     # Mask points where mask is not 1
     # and add cell_area as weight
     data_wgt = data.where(mask == 1).weighted(cell_area)
@@ -90,7 +175,7 @@ def zonal_mean_nemo(data, mask, cell_area, x_name='x', y_name='y', lat_name='nav
 #
 # compute sea ice area
 #
-def seaice_areas(ds, areacello, lsm, sicname='ileadfra', latname='nav_lat'):
+def seaice_areas(ds, areacello, lsm, sicname='ileadfra', latname='nav_lat', dtype=None):
     """
     Compute sea-ice area and extent. 
     
@@ -105,6 +190,8 @@ def seaice_areas(ds, areacello, lsm, sicname='ileadfra', latname='nav_lat'):
     lsm - Land-sea mask for ocean where 1 is ocean and 0 is land. 
     sicname - Name of sea-ice concentration (default: ileadfra)
     latname - Name of latitude array (default: nav_lat)
+    dtype (optional) - e.g. np.float32 to keep ice fraction, cell area and products 
+                       in single precision (see area_mean). Default: None (float64)
     
     Output
     ds - Dataset with the following variables:
@@ -119,13 +206,22 @@ def seaice_areas(ds, areacello, lsm, sicname='ileadfra', latname='nav_lat'):
     # scale from m2 to million km2
     icescale = 1e-12
     
+    sic = graph_checks.maybe_preflight(ds[sicname])
+    
+    if dtype is None:
+        _sum = lambda x: x.sum(('x','y'))
+    else:
+        sic = sic.astype(dtype)
+        areacello = areacello.astype(dtype)
+        _sum = lambda x: _lowprec_sum(x.fillna(0), ('x','y'), dtype=dtype)
+    
     # ice area = icefrac * cell area
-    _nh = (ds[sicname].where(ds[latname] > 0) * areacello).sum(('x','y')) * icescale
-    _sh = (ds[sicname].where(ds[latname] < 0) * areacello).sum(('x','y')) * icescale
+    _nh = _sum(sic.where(ds[latname] > 0) * areacello) * icescale
+    _sh = _sum(sic.where(ds[latname] < 0) * areacello) * icescale
     
     # ice extent = cell area where icefrac > 0.15
-    _nh2 = (ds[sicname].where(ds[latname] > 0).where(ds[sicname] > 0.15) * areacello).sum(('x','y')) * icescale
-    _sh2 = (ds[sicname].where(ds[latname] < 0).where(ds[sicname] > 0.15) * areacello).sum(('x','y')) * icescale
+    _nh2 = _sum(sic.where(ds[latname] > 0).where(sic > 0.15) * areacello) * icescale
+    _sh2 = _sum(sic.where(ds[latname] < 0).where(sic > 0.15) * areacello) * icescale
     
     # give dataarrays names
     _nh.name = 'ar_sia'
@@ -193,4 +289,223 @@ def ice_volumes(ds, areacello, lsm, latname='nav_lat', xname='x', yname='y'):
     
     _ds = xr.merge([_ds_n, _ds_s, _ds_n_thk, _ds_s_thk])
     
-    return _ds
\ No newline at end of file
+    return _ds
+
+#
+# volume integrals
+#
+def layer_weights(depth_top, dz, layers):
+    """
+    Compute the fraction of each model level that lies within each layer. 
+    
+    Levels that are partly inside a layer get a fractional weight, 
+    so e.g. 0-700m and 700-2000m add up to 0-2000m exactly. 
+    
+    Input: 
+    depth_top - 1D DataArray with depth of top of each level, e.g. gdepw_1d from read_nemo_mesh
+    dz - 1D DataArray with thickness of each level, e.g. e3t_1d from read_nemo_mesh
+    layers - Dictionary with layer names and (top, bottom) depths in m. 
+             Bottom can be None for the full depth, 
+             e.g. {'0-700m':(0,700), '700-2000m':(700,2000), 'full':(0,None)}
+    
+    Output: 
+    weights - DataArray (layer, depth) with fraction of each level in each layer
+    """
+    
+    top = depth_top.values
+    bot = top + dz.values
+    
+    weights = []
+    for name, (ztop, zbot) in layers.items():
+        if zbot is None:
+            zbot = np.inf
+        
+        # thickness of overlap between level and layer, as fraction of level thickness
+        overlap = np.minimum(bot, zbot) - np.maximum(top, ztop)
+        weights.append(np.clip(overlap, 0, None) / (bot - top))
+    
+    weights = xr.DataArray(np.array(weights), dims=('layer', depth_top.dims[0]), 
+                           coords={'layer': list(layers.keys())}, name='layer_weights')
+    
+    return weights
+
+
+def _basin_weights(weights, basins):
+    """
+    Multiply weights by each basin mask and put basins along a new dimension
+    """
+    
+    if basins is None:
+        return weights.expand_dims(basin=['global'])
+    
+    basin_weights = xr.concat([weights * mask for mask in basins.values()], dim='basin')
+    basin_weights = basin_weights.assign_coords(basin=list(basins.keys()))
+    
+    return basin_weights
+
+
+def volume_integral_nemo(data, mask, volcello, depth_top, dz, layers=None, basins=None, 
+                         mean=False, ssh=None, depth0=None, weight='volume', rho0=1026.0, 
+                         x_name='x', y_name='y', z_name='deptht'):
+    """
+    Compute volume integral (or volume mean) of NEMO data over depth layers and basins. 
+    
+    Data are first integrated horizontally for each level, 
+    then levels are summed using a weight vector for each layer. 
+    Both steps are done for each chunk of data, so the full 4D product
+    data * volcello is never stored and memory use does not depend on 
+    the length of the time series. 
+    
+    For runs with key_vvl, give ssh and depth0. Cell thickness is then 
+    dz = dz0 * (1 + ssh/depth0) as in compute_dz_tilde, but the stretching factor 
+    is applied to each column after the vertical sum, so the time-varying 
+    thickness is never stored as a 4D array. 
+    Layers are defined from the reference (ssh=0) depths. 
+    
+    Input: 
+    data - DataArray with NEMO data on T points (time, deptht, y, x)
+    mask - 3D land-sea mask, e.g. tmask
+    volcello - Cell volume, e.g. volcello from read_nemo_mesh
+    depth_top - 1D depth of top of each level, e.g. gdepw_1d from read_nemo_mesh
+    dz - 1D thickness of each level, e.g. e3t_1d from read_nemo_mesh
+    layers (optional) - Dictionary with layer names and (top, bottom) depths. 
+                        Default: full depth
+    basins (optional) - Dictionary with basin names and 2D basin masks, 
+                        e.g. {'atl':tmaskatl, 'pac':tmaskpac} from maskglo file. 
+                        Default: global
+    mean (optional) - Compute volume mean instead of integral (default: False)
+    ssh (optional) - Sea-surface height (time, y, x) for runs with key_vvl. Default: None
+    depth0 (optional) - Depth of ocean assuming ssh=0, required with ssh
+    weight (optional) - 'volume' (default) for data * volume, 'mass' for data * mass
+    rho0 (optional) - Reference density for mass weighting (default: 1026 kg/m3)
+    x_name, y_name, z_name (optional) - Names of dimensions (default: x, y, deptht)
+    
+    Output: 
+    data_int - DataArray (time, basin, layer) with volume integral or mean
+    """
+    
+    if weight not in ['volume', 'mass']:
+        raise ValueError("weight must be 'volume' or 'mass', not %s" % (weight,))
+    
+    if layers is None:
+        layers = {'full': (0, None)}
+    
+    data = graph_checks.maybe_preflight(data)
+    
+    # weights for each layer as (layer, depth)
+    lw = layer_weights(depth_top, dz, layers)
+    
+    # volume of each (basin, depth, y, x) cell. Static, i.e. no time dimension
+    wgt = _basin_weights(volcello * (mask == 1), basins)
+    
+    if ssh is None:
+        # horizontal integral for each level and basin, chunk by chunk
+        # then sum over levels in each layer
+        profile = xr.dot(data.where(mask == 1).fillna(0), wgt, dim=[x_name, y_name])
+        data_int = xr.dot(profile, lw, dim=z_name)
+        
+        if mean:
+            vol = xr.dot(wgt.sum((x_name, y_name)), lw, dim=z_name)
+    
+    else:
+        if depth0 is None:
+            raise ValueError('depth0 is required when ssh is given')
+        
+        # Stretching factor for each column and time (3D, not 4D)
+        stretch = vvl_scale_factor(ssh, depth0)
+        
+        # vertical integral for each layer using reference volumes, 
+        # then horizontal integral with stretching factor and basin masks
+        vol0 = volcello * (mask == 1)
+        column = xr.dot(data.where(mask == 1).fillna(0), vol0, lw, dim=z_name)
+        basin_masks = _basin_weights(xr.ones_like(depth0), basins)
+        data_int = xr.dot(column, stretch, basin_masks, dim=[x_name, y_name])
+        
+        if mean:
+            vol_column = xr.dot(vol0, lw, dim=z_name)
+            vol = xr.dot(vol_column, stretch, basin_masks, dim=[x_name, y_name])
+    
+    if mean:
+        data_int = data_int / vol
+    elif weight == 'mass':
+        data_int = data_int * rho0
+    
+    # same order on both paths
+    data_int = data_int.transpose(..., 'basin', 'layer')
+    data_int.name = data.name
+    
+    return data_int
+
+
+def ocean_depth(ds_mesh):
+    """
+    Depth of ocean (sum of cell thickness) assuming ssh=0, 
+    i.e. what NEMO calls ht_0. 
+    """
+    
+    depth0 = (ds_mesh['dzt'] * ds_mesh['tmask']).sum('deptht')
+    depth0.name = 'depth0'
+    
+    return depth0
+
+
+def ocean_heat_content(thetao, ds_mesh, layers=None, basins=None, ssh=None, 
+                       rho0=1026.0, cp=3991.86795711963):
+    """
+    Compute ocean heat content by layer and basin. 
+    
+    Input: 
+    thetao - Potential temperature in degC, e.g. votemper from grid_T files
+    ds_mesh - Dataset from read_nemo_mesh
+    layers (optional) - Dictionary with layer names and (top, bottom) depths. 
+                        Default: 0-700m, 700-2000m, full depth
+    basins (optional) - Dictionary with basin names and 2D masks. Default: global
+    ssh (optional) - Sea-surface height for runs with key_vvl. Default: None
+    rho0 (optional) - Reference density (default: 1026 kg/m3 as in NEMO)
+    cp (optional) - Specific heat capacity (default: 3991.87 J/kg/K as in TEOS-10)
+    
+    Output: 
+    ohc - DataArray (time, basin, layer) with heat content in J
+    """
+    
+    if layers is None:
+        layers = {'0-700m': (0, 700), '700-2000m': (700, 2000), 'full': (0, None)}
+    
+    ohc = volume_integral_nemo(thetao, ds_mesh['tmask'], ds_mesh['volcello'], 
+                               ds_mesh['gdepw_1d'], ds_mesh['e3t_1d'], 
+                               layers=layers, basins=basins, 
+                               ssh=ssh, depth0=None if ssh is None else ocean_depth(ds_mesh)) * rho0 * cp
+    ohc.name = 'ohc'
+    ohc = ohc.assign_attrs(units='J')
+    
+    return ohc
+
+
+def ocean_salt_content(so, ds_mesh, layers=None, basins=None, ssh=None, rho0=1026.0):
+    """
+    Compute ocean salt content by layer and basin. 
+    
+    Input: 
+    so - Salinity in g/kg (psu), e.g. vosaline from grid_T files
+    ds_mesh - Dataset from read_nemo_mesh
+    layers (optional) - Dictionary with layer names and (top, bottom) depths. 
+                        Default: 0-700m, 700-2000m, full depth
+    basins (optional) - Dictionary with basin names and 2D masks. Default: global
+    ssh (optional) - Sea-surface height for runs with key_vvl. Default: None
+    rho0 (optional) - Reference density (default: 1026 kg/m3 as in NEMO)
+    
+    Output: 
+    osc - DataArray (time, basin, layer) with salt content in kg
+    """
+    
+    if layers is None:
+        layers = {'0-700m': (0, 700), '700-2000m': (700, 2000), 'full': (0, None)}
+    
+    osc = volume_integral_nemo(so, ds_mesh['tmask'], ds_mesh['volcello'], 
+                               ds_mesh['gdepw_1d'], ds_mesh['e3t_1d'], 
+                               layers=layers, basins=basins, 
+                               ssh=ssh, depth0=None if ssh is None else ocean_depth(ds_mesh)) * rho0 * 1e-3
+    osc.name = 'osc'
+    osc = osc.assign_attrs(units='kg')
+    
+    return osc
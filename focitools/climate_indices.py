@@ -1,8 +1,22 @@
 import numpy as np
 import xarray as xr
-from focitools import functions
+from focitools import area_averages_and_integrals
+from focitools import regions
+from focitools import graph_checks
 
-def compute_nino_index(sst, index='NINO3.4', time_name='time'):
+# Regions, running means and El Nino / La Nina thresholds for each index
+# NINO1+2: (0-10S, 90W-80W)
+# NINO3: (5N-5S, 150W-90W)
+# NINO3.4: (5N-5S, 170W-120W), 5-month running mean 
+# NINO4: (5N-5S, 160E-150W)
+# ONI: (5N-5S, 170W-120W), 3-month running mean
+nino_regions = {'NINO1+2': {'lon_range':(270,280), 'lat_range':(-10,0), 'runmean':5, 'cut':0.4}, 
+                'NINO3':   {'lon_range':(210,270), 'lat_range':(-5,5),  'runmean':5, 'cut':0.4}, 
+                'NINO3.4': {'lon_range':(190,240), 'lat_range':(-5,5),  'runmean':5, 'cut':0.4}, 
+                'NINO4':   {'lon_range':(160,210), 'lat_range':(-5,5),  'runmean':5, 'cut':0.4}, 
+                'ONI':     {'lon_range':(190,240), 'lat_range':(-5,5),  'runmean':3, 'cut':0.5}}
+
+def compute_nino_index(sst, index='NINO3.4', time_name='time', lon_name='lon', lat_name='lat'):
     """
     Compute ENSO indices from monthly SST anomalies using an area mean over the tropical Pacific. 
     The area and time averaging depends on the chosen index. 
@@ -14,6 +28,8 @@ def compute_nino_index(sst, index='NINO3.4', time_name='time'):
     so the user can easily compute an El Nino composite. 
     For u10 anomalies: 
     u10_comp = u10_anomalies.isel(time=en).mean('time')
+    For large fields, or several composites, compute_composites 
+    (with enso_classes and compute_enso_indices) does all classes in one pass. 
     
     
     Reference
@@ -24,8 +40,10 @@ def compute_nino_index(sst, index='NINO3.4', time_name='time'):
     -----
     sst - Monthly SST field as xarray.DataArray 
     index (optional) - which index to compute, 
-                       'NINO1+2', 'NINO3', 'NINO3.4' (default), ONI. 
-    time_name - Name of time dimension
+                       'NINO1+2', 'NINO3', 'NINO3.4' (default), 'NINO4', 'ONI'. 
+    time_name (optional) - Name of time dimension (default: time)
+    lon_name (optional) - Name of longitude (default: lon)
+    lat_name (optional) - Name of latitude (default: lat)
     
     Output
     ------
@@ -35,46 +53,196 @@ def compute_nino_index(sst, index='NINO3.4', time_name='time'):
     
     """
     
+    if index not in nino_regions:
+        raise ValueError('Unknown index: %s' % (index,))
+    
+    lon_range = nino_regions[index]['lon_range']
+    lat_range = nino_regions[index]['lat_range']
+    runmean = nino_regions[index]['runmean']
+    el_nino_cut = nino_regions[index]['cut']
+    la_nina_cut = -nino_regions[index]['cut']
+    
+    # Select region before computing anomalies, 
+    # so we only read and process the SST we need. 
+    # Points in the hyperslab but outside the region (e.g. across the dateline) are masked
+    sst_box = regions.subset_region(sst, lon_range=lon_range, lat_range=lat_range, 
+                                    lon_name=lon_name, lat_name=lat_name, mask=True)
+    sst_box = graph_checks.maybe_preflight(sst_box, time_name=time_name)
+    
     # compute monthly anomalies
-    sst_anom = sst.groupby(time_name+'.month') - sst.groupby(time_name+'.month').mean(time_name)
-    
-    # select region
-    # NINO1+2: (0-10S, 90W-80W)
-    # NINO3: (5N-5S, 150W-90W)
-    # NINO3.4: (5N-5S, 170W-120W), 5-month running mean 
-    # ONI: (5N-5S, 170W-120W), 3-month running mean
-    if index = 'NINO1+2':
-        sst_nino = sst_anom.sel(lon=slice(270,280), lat=slice(-10,0))
-        runmean = 5
-        
-    elif index = 'NINO3':
-        sst_nino = sst_anom.sel(lon=slice(210,270),lat=slice(-5,5))
-        runmean = 5
-    
-    elif index = 'NINO3.4':
-        sst_nino = sst_anom.sel(lon=slice(190,240),lat=slice(-5,5))
-        runmean = 5
-        el_nino_cut = 0.4
-        la_nina_cut = -0.4
-        
-    elif index = 'ONI':
-        sst_nino = sst_anom.sel(lon=slice(190,240),lat=slice(-5,5))
-        runmean = 3
-        el_nino_cut = 0.5
-        la_nina_cut = -0.5
+    sst_nino = sst_box.groupby(time_name+'.month') - sst_box.groupby(time_name+'.month').mean(time_name)
         
     # Average over region 
-    nino_m = functions.area_mean(sst_nino)
+    nino_m = area_averages_and_integrals.area_mean(sst_nino, lon_name=lon_name, lat_name=lat_name)
     
     # Running mean
-    nino_raw = nino_m.rolling(time=runmean, center=True).mean()
+    nino_raw = nino_m.rolling({time_name: runmean}, center=True).mean()
     
     # Find El Nino and La Nina events
-    vals = nino_raw.fillna(0).data
+    vals = nino_raw.fillna(0).values
     en = np.where(vals >= el_nino_cut)
     ln = np.where(vals <= la_nina_cut)
     
     # Normalise index
     nino = (nino_raw - nino_raw.mean(time_name)) / nino_raw.std(time_name)
     
-    return nino, en, ln
\ No newline at end of file
+    return nino, en, ln
+
+
+def compute_enso_indices(sst, indices=['NINO1+2','NINO3','NINO3.4','NINO4','ONI','TNI'], 
+                         time_name='time', lon_name='lon', lat_name='lat', areacello=None):
+    """
+    Compute several ENSO indices from one read of SST. 
+    
+    SST is only read for the smallest box containing all regions, 
+    monthly anomalies are computed once for that box, 
+    and all regions are averaged together in one pass. 
+    Works for regular grids (lon, lat) and for NEMO (nav_lon, nav_lat). 
+    
+    Reference
+    ----
+    https://climatedataguide.ucar.edu/climate-data/nino-sst-indices-nino-12-3-34-4-oni-and-tni
+    
+    Input
+    -----
+    sst - Monthly SST field as xarray.DataArray 
+    indices (optional) - List of indices to compute. 
+                         Default: all of 'NINO1+2', 'NINO3', 'NINO3.4', 'NINO4', 'ONI', 'TNI'
+    time_name (optional) - Name of time dimension (default: time)
+    lon_name (optional) - Name of longitude (default: lon)
+    lat_name (optional) - Name of latitude (default: lat)
+    areacello (optional) - Cell area on the same grid as sst, e.g. from read_nemo_mesh. 
+                           Default: cos(lat), which is only right for regular lon/lat grids
+    
+    Output
+    ------
+    ds - xarray.Dataset with normalised index for each of indices, 
+         and masks <index>_en (True for El Nino) and <index>_ln (True for La Nina). 
+         TNI has no event masks. 
+    """
+    
+    # area sums for all regions, in one pass over SST
+    box_sums = _enso_box_sums(sst, indices, time_name=time_name, lon_name=lon_name, lat_name=lat_name, 
+                              areacello=areacello)
+    
+    return _enso_from_box_sums(box_sums.compute(), indices, time_name=time_name)
+
+
+def _enso_regions(indices):
+    """
+    NINO regions needed for a list of indices. TNI uses NINO1+2 and NINO4
+    """
+    
+    needed = []
+    for index in indices:
+        if index == 'TNI':
+            needed += ['NINO1+2', 'NINO4']
+        elif index in nino_regions:
+            needed.append(index)
+        else:
+            raise ValueError('Unknown index: %s' % (index,))
+    
+    return list(dict.fromkeys(needed))
+
+
+def _box_name(index):
+    """
+    Name of the first region with the same box as index, 
+    e.g. ONI uses the NINO3.4 box
+    """
+    
+    for name, region in nino_regions.items():
+        if (region['lon_range'], region['lat_range']) == \
+           (nino_regions[index]['lon_range'], nino_regions[index]['lat_range']):
+            return name
+
+
+def _enso_box_sums(sst, indices, time_name='time', lon_name='lon', lat_name='lat', areacello=None):
+    """
+    Lazy area-weighted sums of monthly SST anomalies for all boxes needed for indices. 
+    Weights are areacello if given, otherwise cos(lat). 
+    
+    Output
+    ------
+    ds - Dataset with 'sum' (weighted sum of anomalies) and 'wgt' (sum of weights 
+         where there is data) for each time and box
+    """
+    
+    needed = _enso_regions(indices)
+    
+    # smallest box that contains all regions
+    # none of the regions cross 0E, so the union is simply the min and max
+    lon_range = (min([nino_regions[i]['lon_range'][0] for i in needed]), 
+                 max([nino_regions[i]['lon_range'][1] for i in needed]))
+    lat_range = (min([nino_regions[i]['lat_range'][0] for i in needed]), 
+                 max([nino_regions[i]['lat_range'][1] for i in needed]))
+    bounds = regions.region_bounds(sst[lon_name], sst[lat_name], lon_range=lon_range, lat_range=lat_range)
+    sst_box = graph_checks.maybe_preflight(sst.isel(bounds), time_name=time_name)
+    
+    # compute monthly anomalies, once 
+    sst_anom = sst_box.groupby(time_name+'.month') - sst_box.groupby(time_name+'.month').mean(time_name)
+    
+    # Area weights for each region, cell area or cos(lat) on regular grids
+    # Regions with the same box (NINO3.4, ONI) are only averaged once
+    boxes = list(dict.fromkeys([_box_name(i) for i in needed]))
+    lon, lat = sst_box[lon_name], sst_box[lat_name]
+    if lon.ndim == 1:
+        dims = (lat.dims[0], lon.dims[0])
+        area = np.cos(np.deg2rad(lat.values))[:, None] * np.ones(lon.shape)[None, :]
+    else:
+        dims = lon.dims
+        area = np.cos(np.deg2rad(lat.values))
+    if areacello is not None:
+        area = areacello.isel(bounds).transpose(*dims).fillna(0).values
+    
+    weights = []
+    for box in boxes:
+        w = area * regions.region_mask(lon, lat, lon_range=nino_regions[box]['lon_range'], 
+                                         lat_range=nino_regions[box]['lat_range'])
+        weights.append(w)
+    weights = xr.DataArray(np.array(weights), dims=('box',) + dims, coords={'box': boxes})
+    
+    # Sums over all regions in one pass
+    # Weights are later normalised by the sum of weights where there is data (i.e. not land)
+    ds = xr.Dataset({'sum': xr.dot(sst_anom.fillna(0), weights, dim=list(dims)), 
+                     'wgt': xr.dot(sst_anom.notnull(), weights, dim=list(dims))})
+    ds = ds.drop_vars('month', errors='ignore')
+    
+    return ds
+
+
+def _enso_from_box_sums(box_sums, indices, time_name='time'):
+    """
+    Compute indices and El Nino / La Nina masks from output of _enso_box_sums
+    """
+    
+    box_mean = box_sums['sum'] / box_sums['wgt']
+    
+    def _box(index):
+        return box_mean.sel(box=_box_name(index), drop=True)
+    
+    ds = xr.Dataset()
+    for index in indices:
+        
+        if index == 'TNI':
+            # Trenberth and Stepaniak (2001): 
+            # normalised NINO1+2 minus normalised NINO4, 5-month running mean
+            n12, n4 = _box('NINO1+2'), _box('NINO4')
+            tni = n12 / n12.std(time_name) - n4 / n4.std(time_name)
+            tni = tni.rolling({time_name: 5}, center=True).mean()
+            ds['TNI'] = (tni - tni.mean(time_name)) / tni.std(time_name)
+            continue
+        
+        # Running mean
+        runmean = nino_regions[index]['runmean']
+        nino_raw = _box(index).rolling({time_name: runmean}, center=True).mean()
+        
+        # El Nino and La Nina events
+        cut = nino_regions[index]['cut']
+        ds[index+'_en'] = nino_raw.fillna(0) >= cut
+        ds[index+'_ln'] = nino_raw.fillna(0) <= -cut
+        
+        # Normalise index
+        ds[index] = (nino_raw - nino_raw.mean(time_name)) / nino_raw.std(time_name)
+    
+    return ds
@@ -0,0 +1,176 @@
+import numpy as np
+import xarray as xr
+from focitools import eos
+
+
+def _column_search(values, depth, mask, threshold, sign, delta, ref_depth, fill_bottom):
+    """
+    Find the depth where each column first crosses a target value,
+    with linear interpolation between levels.
+    Depth is the last axis of values, depth and mask.
+    """
+
+    values = np.asarray(values)
+    depth = np.broadcast_to(depth, values.shape)
+    valid = np.broadcast_to(mask != 0, values.shape) & np.isfinite(values)
+
+    # number of valid levels in each column
+    nvalid = valid.sum(axis=-1)
+    last = np.maximum(nvalid - 1, 0)
+
+    def _take(a, k):
+        return np.take_along_axis(a, k[..., None], axis=-1)[..., 0]
+
+    # target value, either fixed or relative to the value at ref_depth
+    if ref_depth is None:
+        target = np.full(values.shape[:-1], float(threshold))
+        below = valid
+    else:
+        # levels above ref_depth, i.e. index of ref_depth in each column
+        k = np.clip(np.sum((depth < ref_depth) & valid, axis=-1), 1, values.shape[-1] - 1)
+        z0, z1 = _take(depth, k - 1), _take(depth, k)
+        v0, v1 = _take(values, k - 1), _take(values, k)
+        w = np.clip((ref_depth - z0) / (z1 - z0), 0, 1)
+        target = v0 + w * (v1 - v0) + sign * delta
+        below = valid & (depth > ref_depth)
+
+    # distance past target, positive once crossed
+    with np.errstate(invalid='ignore'):
+        d = sign * (values - target[..., None])
+    crossed = (d > 0) & below
+
+    # first level that has crossed
+    k = np.argmax(crossed, axis=-1)
+    found = _take(crossed, k)
+
+    # interpolate between level above and first crossed level
+    km = np.maximum(k - 1, 0)
+    z0, z1 = _take(depth, km), _take(depth, k)
+    d0, d1 = _take(d, km), _take(d, k)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        w = np.clip(-d0 / (d1 - d0), 0, 1)
+    result = np.where(k > 0, z0 + w * (z1 - z0), np.nan)
+
+    # columns that never cross
+    bottom = _take(depth, last) if fill_bottom else np.nan
+    result = np.where(found, result, bottom)
+
+    # land
+    result = np.where(nvalid > 0, result, np.nan)
+
+    return result
+
+
+def crossing_depth(data, ds_mesh, threshold=None, delta=0.0, ref_depth=None,
+                   direction='increase', fill_bottom=False, z_name='deptht'):
+    """
+    Find the depth where a field first crosses a value, searching down each column.
+
+    The crossing level is found with argmax along depth, and the depth is
+    interpolated linearly between the crossing level and the level above.
+    Columns are searched blockwise for each time chunk (apply_ufunc),
+    so only one chunk of masks is made at a time.
+
+    Input
+    -----
+    data - DataArray with depth, e.g. thetao or sigma0 from read_nemo grid_T
+    ds_mesh - Mesh from read_nemo_mesh, with gdept and tmask
+    threshold (optional) - Value to cross, e.g. 20 for the 20C isotherm
+    delta (optional) - Difference from value at ref_depth to cross, e.g. 0.03 kg/m3 (default: 0)
+    ref_depth (optional) - Reference depth (m). If given, the target is value at
+                           ref_depth +/- delta, and only levels below are searched
+    direction (optional) - 'increase' to find where data becomes larger than target
+                           (e.g. density), or 'decrease' for smaller (e.g. temperature)
+    fill_bottom (optional) - Use bottom depth where a column does not cross (True),
+                             or NaN (False, default)
+    z_name (optional) - Name of depth dimension (default: deptht)
+
+    Output
+    ------
+    depth - DataArray with crossing depth (m) for each time and column.
+            NaN on land, and where the first level has already crossed threshold
+    """
+
+    if direction == 'increase':
+        sign = 1
+    elif direction == 'decrease':
+        sign = -1
+    else:
+        raise ValueError("direction must be 'increase' or 'decrease', not %s" % (direction,))
+
+    if (threshold is None) == (ref_depth is None):
+        raise ValueError('Give either threshold or ref_depth')
+
+    depth = xr.apply_ufunc(_column_search, data, ds_mesh['gdept'], ds_mesh['tmask'],
+                           input_core_dims=[[z_name], [z_name], [z_name]],
+                           kwargs={'threshold': threshold, 'sign': sign, 'delta': delta,
+                                   'ref_depth': ref_depth, 'fill_bottom': fill_bottom},
+                           dask='parallelized', output_dtypes=[np.float64])
+    depth = depth.assign_attrs(units='m')
+
+    return depth
+
+
+def mixed_layer_depth(thetao, so, ds_mesh, criterion='density', delta=None, ref_depth=10.0,
+                      z_name='deptht'):
+    """
+    Compute mixed-layer depth from potential temperature and salinity.
+
+    Reference
+    ---------
+    de Boyer Montegut et al. (2004), JGR, doi:10.1029/2004JC002378
+
+    Input
+    -----
+    thetao - Potential temperature (degC), e.g. votemper from read_nemo grid_T
+    so - Salinity (psu), e.g. vosaline. Not used for criterion='temperature'
+    ds_mesh - Mesh from read_nemo_mesh
+    criterion (optional) - 'density' (sigma0 increase, default) or 'temperature' (decrease)
+    delta (optional) - Threshold. Default: 0.03 kg/m3 for density, 0.2 degC for temperature
+    ref_depth (optional) - Reference depth in m (default: 10)
+    z_name (optional) - Name of depth dimension (default: deptht)
+
+    Output
+    ------
+    mld - DataArray with mixed-layer depth (m). Bottom depth where the column is mixed to the bottom
+    """
+
+    if criterion == 'density':
+        data = eos.sigma0(thetao, so)
+        delta = 0.03 if delta is None else delta
+        direction = 'increase'
+    elif criterion == 'temperature':
+        data = thetao
+        delta = 0.2 if delta is None else delta
+        direction = 'decrease'
+    else:
+        raise ValueError("criterion must be 'density' or 'temperature', not %s" % (criterion,))
+
+    mld = crossing_depth(data, ds_mesh, delta=delta, ref_depth=ref_depth, direction=direction,
+                         fill_bottom=True, z_name=z_name)
+    mld.name = 'mld'
+
+    return mld
+
+
+def isotherm_depth(thetao, ds_mesh, isotherm=20.0, z_name='deptht'):
+    """
+    Depth of an isotherm, e.g. the 20C isotherm used as thermocline depth for ENSO
+
+    Input
+    -----
+    thetao - Potential temperature (degC), e.g. votemper from read_nemo grid_T
+    ds_mesh - Mesh from read_nemo_mesh
+    isotherm (optional) - Temperature (default: 20)
+    z_name (optional) - Name of depth dimension (default: deptht)
+
+    Output
+    ------
+    depth - DataArray with depth of isotherm (m). NaN where the column is
+            everywhere warmer or colder than isotherm
+    """
+
+    depth = crossing_depth(thetao, ds_mesh, threshold=isotherm, direction='decrease', z_name=z_name)
+    depth.name = 'd%g' % (isotherm,)
+
+    return depth
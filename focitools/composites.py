@@ -0,0 +1,107 @@
+import numpy as np
+import xarray as xr
+
+
+def enso_classes(ds_enso, index='NINO3.4', time_name='time'):
+    """
+    Classify each time step as El Nino, La Nina or neutral.
+
+    Input
+    -----
+    ds_enso - Dataset from compute_enso_indices
+    index (optional) - Which index to use (default: NINO3.4)
+    time_name (optional) - Name of time dimension (default: time)
+
+    Output
+    ------
+    classes - DataArray along time with 'el_nino', 'la_nina' or 'neutral'
+    """
+
+    classes = xr.where(ds_enso[index+'_en'], 'el_nino',
+                       xr.where(ds_enso[index+'_ln'], 'la_nina', 'neutral'))
+    classes.name = 'enso_class'
+
+    return classes
+
+
+def compute_composites(data, classes, labels=None, count=False, variance=False, time_name='time'):
+    """
+    Compute composite means (and optionally counts and variances) for all classes
+    in one pass over the data.
+
+    Instead of one isel(time=...) per class, which makes scattered reads and
+    one pass per composite, every class is accumulated from each time chunk
+    at once, using a (class, time) indicator matrix.
+
+    Input
+    -----
+    data - DataArray with time dimension, e.g. u10 anomalies, SST or 3D temperature
+    classes - DataArray or array along time with class of each time step,
+              e.g. from enso_classes, or any categorical series (ints, strings).
+              A DataArray with time is matched to data by time, and must have
+              all time steps of data. An array must have the same length as data
+    labels (optional) - Which classes to compute composites for. Default: all classes found
+    count (optional) - Also return number of time steps in each class (default: False)
+    variance (optional) - Also return variance in each class (default: False)
+    time_name (optional) - Name of time dimension (default: time)
+
+    Output
+    ------
+    ds - Dataset with 'mean' and optionally 'count' and 'variance',
+         with a 'category' dimension (one for each class)
+
+    Example
+    -------
+    ds_enso = compute_enso_indices(sst)
+    comp = compute_composites(u10_anomalies, enso_classes(ds_enso))
+    comp['mean'].sel(category='el_nino')
+    """
+
+    # match classes to the time steps of data
+    times = data[time_name]
+    if isinstance(classes, xr.DataArray) and time_name in classes.coords:
+        missing = ~times.isin(classes[time_name].values)
+        if missing.any():
+            raise ValueError('classes has no class for %d time steps of data, e.g. %s' %
+                             (int(missing.sum()), times.values[missing.values][0]))
+        classes = classes.sel({time_name: times.values})
+    elif len(classes) != data.sizes[time_name]:
+        raise ValueError('classes has %d time steps, but data has %d' %
+                         (len(classes), data.sizes[time_name]))
+
+    classes = np.asarray(classes)
+    if labels is None:
+        labels = np.unique(classes)
+
+    # indicator matrix, 1 where time step is in class
+    onehot = xr.DataArray(np.array([classes == c for c in labels], dtype=data.dtype),
+                          dims=('category', time_name), coords={'category': np.asarray(labels)})
+
+    # Shift data by the first time step, so that variance from
+    # sums of squares is accurate also when the mean is large
+    valid = data.notnull()
+    if variance:
+        ref = data.isel({time_name: 0}, drop=True).fillna(0)
+        shifted = (data - ref).fillna(0)
+    else:
+        shifted = data.fillna(0)
+
+    # Sums for all classes. These are computed together, so data is only read once
+    n = xr.dot(valid.astype(data.dtype), onehot, dim=time_name)
+    s1 = xr.dot(shifted, onehot, dim=time_name)
+
+    mean = s1 / n
+    if variance:
+        s2 = xr.dot(shifted**2, onehot, dim=time_name)
+        var = (s2 - s1**2 / n) / (n - 1)
+        mean = mean + ref
+
+    ds = xr.Dataset({'mean': mean})
+    if count:
+        ds['count'] = n
+    if variance:
+        ds['variance'] = var
+
+    ds = ds.drop_vars([c for c in ds.coords if time_name in ds[c].dims], errors='ignore')
+
+    return ds
@@ -0,0 +1,172 @@
+import numpy as np
+import xarray as xr
+
+
+def _anomalies(data, anomalies, time_name):
+    """
+    Remove monthly climatology ('monthly'), time mean ('mean') or nothing (None)
+    """
+
+    # The climatology is computed first, in its own pass over data,
+    # so later passes only need one time chunk at a time
+    if anomalies == 'monthly':
+        clim = data.groupby(time_name+'.month').mean(time_name).compute()
+        return (data.groupby(time_name+'.month') - clim).drop_vars('month', errors='ignore')
+    elif anomalies == 'mean':
+        return data - data.mean(time_name).compute()
+    elif anomalies is None:
+        return data
+    else:
+        raise ValueError("anomalies must be 'monthly', 'mean' or None, not %s" % (anomalies,))
+
+
+def _randomized_svd(X, k, n_power_iter=4, oversampling=10, seed=0):
+    """
+    Randomized SVD (Halko et al. 2011) of a dask array X (time, points)
+    chunked in time only.
+
+    Each product with X (X @ Q or X.T @ Q) is computed in its own pass over the
+    time chunks, and only the (time, k) and (points, k) matrices are kept between
+    passes, so X is never held in memory. X.T @ Q is summed over chunks in a tree,
+    so a few (points, k) partial sums are held at once.
+    The total sum of squares of X is found in the first pass.
+    """
+
+    import dask.array as da
+
+    rng = np.random.default_rng(seed)
+    nt, npoints = X.shape
+    l = min(k + oversampling, nt, npoints)
+
+    def _orth(a):
+        return np.linalg.qr(a)[0]
+
+    def _xq(Q):
+        # X @ Q, one block of rows for each time chunk
+        return X.dot(Q)
+
+    def _xtq(Q):
+        # X.T @ Q for each time chunk, then summed over chunks
+        Qd = da.from_array(Q, chunks=(X.chunks[0], -1))
+        parts = da.map_blocks(lambda x, q: (x.T @ q)[None], X, Qd, new_axis=2, dtype=X.dtype,
+                              chunks=((1,) * len(X.chunks[0]), (npoints,), (Q.shape[1],)))
+        return parts.sum(axis=0, split_every=2)
+
+    # range of X from random projection, and total variance
+    Y, total = da.compute(_xq(rng.standard_normal((npoints, l)).astype(X.dtype)), (X**2).sum())
+    Q = _orth(Y)
+
+    # power iterations, re-orthonormalised each time
+    for i in range(n_power_iter):
+        Q = _orth(_xtq(Q).compute())
+        Q = _orth(_xq(Q).compute())
+
+    # SVD of the small matrix B = Q.T @ X
+    B = _xtq(Q).compute().T
+    ub, s, v = np.linalg.svd(B, full_matrices=False)
+    u = Q @ ub
+
+    return u[:, :k], s[:k], v[:k], total
+
+
+def compute_eofs(data, weights=None, mask=None, neofs=5, method='randomized', anomalies='monthly',
+                 time_name='time', lat_name='lat', n_power_iter=4, seed=0):
+    """
+    Compute Empirical Orthogonal Functions (EOFs) of a field, e.g. SLP from OpenIFS
+    or SST from NEMO, for records that do not fit in memory.
+
+    Anomalies are weighted by sqrt(area), land (or masked) points are removed,
+    and the leading modes are found with a blockwise SVD over time chunks.
+    With method='randomized', the climatology and each product with the data
+    are separate passes over the time chunks (3 + 2 * n_power_iter reads of data),
+    so memory use is set by the chunk size and the number of modes,
+    not by the length of the record.
+
+    Input
+    -----
+    data - DataArray with time and horizontal dimensions, e.g. (time, lat, lon) or (time, y, x)
+    weights (optional) - Cell area, e.g. areacello from read_nemo_mesh.
+                         Default: cos(lat) as in area_mean, for lon/lat grids
+    mask (optional) - 1 where data should be used, e.g. tmask at surface.
+                      Default: points where data at the first time step is not NaN
+    neofs (optional) - Number of modes (default: 5)
+    method (optional) - 'randomized' (default) for a randomized SVD, which works for any size,
+                        or 'tsqr' for an exact tall-and-skinny QR based SVD,
+                        which needs fewer grid points than time steps (e.g. small regions)
+    anomalies (optional) - 'monthly' (default) removes monthly climatology,
+                           'mean' removes time mean, None uses data as is
+    time_name (optional) - Name of time dimension (default: time)
+    lat_name (optional) - Name of latitude, used for cos(lat) weights (default: lat)
+    n_power_iter (optional) - Power iterations for randomized SVD (default: 4)
+    seed (optional) - Random seed for randomized SVD (default: 0)
+
+    Output
+    ------
+    ds - Dataset with
+         eofs - Spatial patterns (mode, ...), unit length in the weighted space
+         pcs - Principal components (time, mode), i.e. projection of weighted anomalies on eofs
+         explained_variance - Fraction of total (weighted) variance for each mode
+    """
+
+    import dask.array as da
+
+    space_dims = [d for d in data.dims if d != time_name]
+
+    # weights
+    if weights is None:
+        weights = np.cos(np.deg2rad(data[lat_name])).broadcast_like(data.isel({time_name: 0}, drop=True))
+    weights = weights / weights.mean()
+
+    # points to use
+    if mask is None:
+        mask = data.isel({time_name: 0}, drop=True).notnull()
+    valid = ((mask == 1) & np.isfinite(weights)).transpose(*space_dims).values.ravel()
+    points = np.where(valid)[0]
+
+    # weighted anomalies as (time, points) matrix
+    anom = _anomalies(data, anomalies, time_name) * np.sqrt(weights)
+    anom = anom.transpose(time_name, *space_dims)
+    X = anom.data
+    if not isinstance(X, da.Array):
+        X = da.from_array(X, chunks={0: 'auto'})
+    
+    # Use the time chunks of the data (groupby can split them up)
+    time_chunks = data.chunksizes.get(time_name, 'auto')
+    X = X.reshape((X.shape[0], -1), merge_chunks=True).rechunk({0: time_chunks, 1: -1})[:, points]
+    X = da.nan_to_num(X)
+
+    if method == 'randomized':
+        # each product with X is a separate pass over the time chunks
+        u, s, v, total = _randomized_svd(X, neofs, n_power_iter=n_power_iter, seed=seed)
+    elif method == 'tsqr':
+        if X.shape[1] > min(X.chunks[0]):
+            raise ValueError('tsqr needs time chunks (%d) at least as long as the number of points (%d). '
+                             'Use method=randomized or larger time chunks' % (min(X.chunks[0]), X.shape[1]))
+        u, s, v = da.linalg.svd(X)
+        u, s, v = u[:, :neofs], s[:neofs], v[:neofs, :]
+
+        # total variance, computed in the same pass as the SVD
+        u, s, v, total = da.compute(u, s, v, (X**2).sum())
+    else:
+        raise ValueError("method must be 'randomized' or 'tsqr', not %s" % (method,))
+
+    # Put patterns back on the grid
+    shape = [data.sizes[d] for d in space_dims]
+    patterns = np.full((len(s), int(np.prod(shape))), np.nan, dtype=v.dtype)
+    patterns[:, points] = v
+    patterns = patterns.reshape([len(s)] + shape)
+
+    modes = np.arange(1, len(s) + 1)
+    coords = {d: data[d] for d in space_dims if d in data.coords}
+    eofs = xr.DataArray(patterns, dims=['mode'] + space_dims, coords=dict(coords, mode=modes))
+    for c in data.coords:
+        if c not in eofs.coords and set(data[c].dims).issubset(space_dims):
+            eofs = eofs.assign_coords({c: data[c]})
+
+    pcs = xr.DataArray(u * s, dims=(time_name, 'mode'),
+                       coords={time_name: data[time_name], 'mode': modes})
+    explained_variance = xr.DataArray(s**2 / total, dims=('mode',), coords={'mode': modes})
+
+    ds = xr.Dataset({'eofs': eofs, 'pcs': pcs, 'explained_variance': explained_variance})
+
+    return ds
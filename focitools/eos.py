@@ -0,0 +1,73 @@
+import numpy as np
+
+
+def rho_unesco(t, s, p=0.0):
+    """
+    Density of sea water from the UNESCO (EOS-80) equation of state.
+
+    Reference
+    ---------
+    Fofonoff and Millard (1983), UNESCO technical papers in marine science 44.
+    Check value: rho(t=25, s=35, p=10000) = 1062.53817 kg/m3
+
+    Input
+    -----
+    t - Temperature (degC)
+    s - Salinity (psu)
+    p (optional) - Pressure (dbar). Default: 0
+
+    Output
+    ------
+    rho - Density (kg/m3)
+
+    Works with numpy arrays, dask arrays and xarray.DataArrays.
+    Using potential temperature and a reference pressure gives potential density,
+    which is the usual approximation in NEMO and CDFTOOLS diagnostics.
+    """
+
+    # pressure in bar
+    p = p / 10.0
+    s15 = s**1.5
+
+    # density of pure water
+    rho_w = (999.842594 + 6.793952e-2*t - 9.095290e-3*t**2 + 1.001685e-4*t**3
+             - 1.120083e-6*t**4 + 6.536332e-9*t**5)
+
+    # density at surface
+    rho_0 = (rho_w
+             + s * (0.824493 - 4.0899e-3*t + 7.6438e-5*t**2 - 8.2467e-7*t**3 + 5.3875e-9*t**4)
+             + s15 * (-5.72466e-3 + 1.0227e-4*t - 1.6546e-6*t**2)
+             + 4.8314e-4 * s**2)
+
+    if np.all(p == 0):
+        return rho_0
+
+    # secant bulk modulus
+    k_w = 19652.21 + 148.4206*t - 2.327105*t**2 + 1.360477e-2*t**3 - 5.155288e-5*t**4
+    a_w = 3.239908 + 1.43713e-3*t + 1.16092e-4*t**2 - 5.77905e-7*t**3
+    b_w = 8.50935e-5 - 6.12293e-6*t + 5.2787e-8*t**2
+
+    k_0 = (k_w + s * (54.6746 - 0.603459*t + 1.09987e-2*t**2 - 6.1670e-5*t**3)
+           + s15 * (7.944e-2 + 1.6483e-2*t - 5.3009e-4*t**2))
+    a = a_w + s * (2.2838e-3 - 1.0981e-5*t - 1.6078e-6*t**2) + 1.91075e-4 * s15
+    b = b_w + s * (-9.9348e-7 + 2.0816e-8*t + 9.1697e-10*t**2)
+
+    k = k_0 + a*p + b*p**2
+
+    return rho_0 / (1.0 - p / k)
+
+
+def sigma0(t, s):
+    """
+    Potential density anomaly referenced to the surface (kg/m3 - 1000)
+    from potential temperature t (degC) and salinity s (psu)
+    """
+    return rho_unesco(t, s, 0.0) - 1000.0
+
+
+def sigma2(t, s):
+    """
+    Potential density anomaly referenced to 2000 dbar (kg/m3 - 1000)
+    from potential temperature t (degC) and salinity s (psu)
+    """
+    return rho_unesco(t, s, 2000.0) - 1000.0
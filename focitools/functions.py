@@ -1,6 +1,20 @@
+import threading
+
+# Datasets that have already been opened in this session, most recently used last
+_dataset_cache = {}
+
+# Datasets can be opened from several threads (e.g. read_nemo_agrif), 
+# so _dataset_cache is only changed while holding this lock
+_dataset_cache_lock = threading.Lock()
+
+# Largest number of datasets to keep in _dataset_cache
+dataset_cache_size = 32
+
+
 def open_multifile_dataset(files, 
                            concat_dim='time_counter',
-                           chunks={'time_counter':1,'lat':-1,'lon':-1}):
+                           chunks={'time_counter':1,'lat':-1,'lon':-1}, 
+                           cache=True):
     """
     Read a dataset from a list of files. The list should contain files from the same grid, 
     e.g. grid_T files etc. 
@@ -12,6 +26,9 @@ def open_multifile_dataset(files,
                             Is time_counter for OpenIFS, NEMO
                             Is time for ECHAM
     chunks (optional) - Dictionary with chunks for each dimension
+    cache (optional) - Reuse dataset if the same files (with the same modification times) 
+                       have already been opened with the same chunks and concat_dim. 
+                       Default: True. See clear_dataset_cache, invalidate_dataset_cache
 
     Output
     ------
@@ -24,14 +41,278 @@ def open_multifile_dataset(files,
     import cftime
     import xarray as xr
     
+    # Look for the dataset in the session cache. 
+    # The key includes modification times, so files that have been rewritten are read again
+    file_list = resolve_files(files)
+    key = (tuple(sorted(files_signature(file_list).items())), 
+           tuple(sorted(chunks.items())) if isinstance(chunks, dict) else chunks, 
+           concat_dim)
+    if cache:
+        with _dataset_cache_lock:
+            if key in _dataset_cache:
+                _dataset_cache[key] = _dataset_cache.pop(key)
+                return _dataset_cache[key].copy()
+    
     # open multi-file data set. We need to use cftime since the normal python calendar stops working after 2300. 
     # also, we rename time variable from time_counter to time to make life easier
-    ds = xr.open_mfdataset(files,combine='nested', 
+    ds = xr.open_mfdataset(file_list if file_list else files,combine='nested', 
                            chunks=chunks,
                            concat_dim=concat_dim, use_cftime=True,
                            data_vars='minimal', coords='minimal',
                            compat='override',
                            parallel=True)
     
+    if cache:
+        with _dataset_cache_lock:
+            # drop older versions of the same files
+            for k in list(_dataset_cache):
+                if k[1:] == key[1:] and [f for f, mtime in k[0]] == file_list:
+                    del _dataset_cache[k]
+            _dataset_cache[key] = ds
+            while len(_dataset_cache) > dataset_cache_size:
+                del _dataset_cache[next(iter(_dataset_cache))]
+        ds = ds.copy()
+    
     return ds
-    
\ No newline at end of file
+
+
+def clear_dataset_cache():
+    """
+    Remove all datasets from the session cache of open_multifile_dataset
+    """
+
+    with _dataset_cache_lock:
+        _dataset_cache.clear()
+
+
+def invalidate_dataset_cache(files):
+    """
+    Remove datasets that use any of files from the session cache of open_multifile_dataset. 
+    Files that are rewritten get a new modification time and are read again anyway, 
+    so this is mostly needed to free the datasets of one experiment
+
+    Input
+    -----
+    files - File pattern or list of files
+    """
+
+    import fnmatch
+    import os
+
+    # compare patterns rather than resolved files, since files may have been deleted
+    if isinstance(files, str):
+        files = [files]
+    patterns = [os.path.abspath(f) for f in files]
+
+    with _dataset_cache_lock:
+        for key in list(_dataset_cache):
+            cached = [os.path.abspath(f) for f, mtime in key[0]]
+            if any(fnmatch.fnmatch(f, p) for f in cached for p in patterns):
+                del _dataset_cache[key]
+    
+
+def resolve_files(files):
+    """
+    Expand a file pattern (or list of patterns) to a sorted list of files
+
+    Input
+    -----
+    files - File pattern, e.g. '/path/to/exp/outdata/nemo/*grid_T.nc', or list of files/patterns
+
+    Output
+    ------
+    file_list - Sorted list of files
+    """
+
+    import glob
+
+    if isinstance(files, str):
+        files = [files]
+
+    file_list = []
+    for f in files:
+        file_list.extend(glob.glob(f))
+
+    return sorted(set(file_list))
+
+
+def files_signature(files):
+    """
+    Get a dictionary with modification time for each file. 
+    Used to check if data derived from the files (e.g. cached datasets, stores) is up to date. 
+
+    Input
+    -----
+    files - File pattern or list of files
+
+    Output
+    ------
+    signature - Dictionary with file name and modification time
+    """
+
+    import os
+
+    return {f: os.path.getmtime(f) for f in resolve_files(files)}
+
+
+def time_periods(times, freq='1y'):
+    """
+    Label each time step with the period it belongs to
+
+    Input
+    -----
+    times - Array of (cftime) dates
+    freq (optional) - '1y' (label is year) or '1m' (label is year*100 + month). Default: 1y
+
+    Output
+    ------
+    labels - numpy array with one label per time step
+    """
+
+    import numpy as np
+
+    if freq == '1y':
+        return np.array([t.year for t in times])
+    elif freq == '1m':
+        return np.array([t.year * 100 + t.month for t in times])
+    else:
+        raise ValueError("freq must be '1y' or '1m', not %s" % (freq,))
+
+
+def period_days(labels, freq='1y', calendar='standard'):
+    """
+    Number of days in each period from time_periods
+
+    Input
+    -----
+    labels - Period labels from time_periods
+    freq (optional) - '1y' or '1m', as used for time_periods. Default: 1y
+    calendar (optional) - cftime calendar, e.g. noleap. Default: standard
+
+    Output
+    ------
+    days - numpy array with the length of each period in days
+    """
+
+    import numpy as np
+    import cftime
+
+    days = []
+    for label in labels:
+        if freq == '1y':
+            start = cftime.datetime(label, 1, 1, calendar=calendar)
+            end = cftime.datetime(label + 1, 1, 1, calendar=calendar)
+        elif freq == '1m':
+            year, month = divmod(label, 100)
+            start = cftime.datetime(year, month, 1, calendar=calendar)
+            end = cftime.datetime(year + month // 12, month % 12 + 1, 1, calendar=calendar)
+        else:
+            raise ValueError("freq must be '1y' or '1m', not %s" % (freq,))
+        days.append((end - start).days)
+
+    return np.array(days)
+
+
+def _step_days(ds, time_name='time'):
+    """
+    Length of each time step in days, from the time bounds if there are any,
+    otherwise the length of the month for monthly data. 
+    None if neither is known, i.e. all steps are assumed to be equally long. 
+    """
+
+    import numpy as np
+
+    times = ds[time_name].values
+
+    bounds = ds[time_name].attrs.get('bounds', time_name + '_bounds')
+    if bounds in ds.coords or (hasattr(ds, 'data_vars') and bounds in ds.data_vars):
+        b = ds[bounds].values
+        return np.array([(end - start).total_seconds() for start, end in zip(b[:, 0], b[:, 1])]) / 86400.
+
+    # monthly data, i.e. no more than one time step per month
+    months = time_periods(times, freq='1m')
+    if len(np.unique(months)) == len(months):
+        return np.array([t.daysinmonth for t in times], dtype=np.float64)
+
+    return None
+
+
+def downsample(ds, freq='1y', time_name='time'):
+    """
+    Compute yearly or monthly means blockwise, e.g. yearly means from 5-day data. 
+
+    The time chunks are first adjusted so that no period is split between chunks. 
+    Each mean then only needs one chunk, so the full-resolution data is never 
+    held in memory, only one chunk at a time. 
+
+    Time steps are weighted by their length, taken from the time bounds 
+    (e.g. time_counter_bounds in NEMO output) or, for monthly data, 
+    the number of days in each month. Otherwise all time steps have equal weight. 
+    Each time step is counted in the period its time falls in, so means of 
+    steps that cross the end of a period (e.g. monthly means from 5-day data) 
+    are approximate. 
+
+    Input
+    -----
+    ds - Dataset or DataArray with time dimension, e.g. from read_nemo
+    freq (optional) - '1y' or '1m'. Default: 1y
+    time_name (optional) - Name of time dimension. Default: time
+
+    Output
+    ------
+    ds_mean - Dataset or DataArray with one time step per period. 
+              Time, and variables that are not numbers (e.g. time_centered), 
+              are those of the middle time step in each period. 
+    """
+
+    import numpy as np
+    import xarray as xr
+
+    labels = time_periods(ds[time_name].values, freq=freq)
+
+    # number of time steps in each period (labels are in time order)
+    change = np.where(labels[1:] != labels[:-1])[0] + 1
+    starts = np.concatenate([[0], change])
+    sizes = np.diff(np.concatenate([starts, [len(labels)]]))
+
+    # chunks of whole periods, no larger than the current chunks
+    current = ds.chunksizes.get(time_name) if hasattr(ds, 'chunksizes') else None
+    target = max(current) if current else len(labels)
+    chunks = [0]
+    for n in sizes:
+        if chunks[-1] > 0 and chunks[-1] + n > target:
+            chunks.append(0)
+        chunks[-1] += n
+    if current:
+        ds = ds.chunk({time_name: tuple(chunks)})
+
+    period = xr.DataArray(labels, dims=time_name, name='period')
+    middle = starts + sizes // 2
+
+    # weights are the length of each time step, or equal
+    days = _step_days(ds, time_name=time_name)
+    if days is None:
+        days = np.ones(len(labels))
+    weights = xr.DataArray(days, dims=time_name)
+
+    def _mean(data):
+        if data.dtype.kind not in 'iuf':
+            # e.g. time_centered or time bounds, use the middle time step
+            return data.isel({time_name: middle}).rename({time_name: 'period'})
+        total = (data * weights).groupby(period).sum(time_name)
+        wsum = (data.notnull() * weights).groupby(period).sum(time_name)
+        return (total / wsum).astype(np.result_type(data.dtype, np.float32))
+
+    if isinstance(ds, xr.Dataset):
+        ds_mean = ds.copy()
+        for v in ds.data_vars:
+            if time_name in ds[v].dims:
+                ds_mean[v] = _mean(ds[v]).drop_vars(period.name, errors='ignore')
+        ds_mean = ds_mean.drop_dims(time_name)
+    else:
+        ds_mean = _mean(ds)
+
+    # use the middle time step of each period as time
+    ds_mean = ds_mean.rename({'period': time_name}).assign_coords({time_name: ds[time_name].values[middle]})
+
+    return ds_mean
@@ -0,0 +1,186 @@
+import os
+import numpy as np
+import xarray as xr
+
+# Run preflight inside diagnostics (area_mean_nemo, compute_moc_sigma etc), see enable_preflight
+_preflight_enabled = False
+
+
+def _memory_budget():
+    """
+    Memory and threads per worker.
+    Uses the smallest worker if there is a dask.distributed client,
+    otherwise the memory and cores of this machine
+    """
+
+    try:
+        from distributed import get_client
+        workers = get_client().scheduler_info()['workers'].values()
+        worker = min(workers, key=lambda w: w['memory_limit'])
+        if worker['memory_limit']:
+            return worker['memory_limit'], worker['nthreads']
+    except (ImportError, ValueError):
+        pass
+
+    total = os.sysconf('SC_PAGE_SIZE') * os.sysconf('SC_PHYS_PAGES')
+
+    return total, os.cpu_count() or 1
+
+
+def _dask_variables(obj):
+    """
+    Dask-backed variables (data and coordinates) in a Dataset or DataArray
+    """
+
+    if isinstance(obj, xr.DataArray):
+        obj = obj.to_dataset(name=obj.name or '__data__')
+
+    return {v: obj[v] for v in obj.variables if obj[v].chunks is not None}
+
+
+def estimate_cost(obj, overhead=3, threads=None):
+    """
+    Estimate the cost of computing a lazy Dataset or DataArray from its chunk metadata,
+    without computing anything.
+
+    Input
+    -----
+    obj - Dataset or DataArray, e.g. from read_nemo, or the output of a diagnostic
+    overhead (optional) - Temporaries per chunk (masks, products etc) (default: 3)
+    threads (optional) - Tasks running at the same time on a worker.
+                         Default: from dask.distributed client, or number of cores
+
+    Output
+    ------
+    estimate - Dictionary with
+               tasks - Estimated number of tasks in the graph, i.e. chunks times graph layers
+                       for each variable. Counted without building the graph
+               bytes_to_read - Total size of all dask-backed variables
+               max_chunk_bytes - Size of the largest chunk
+               peak_memory - Estimated peak memory per worker,
+                             threads * overhead * max_chunk_bytes
+    """
+
+    if threads is None:
+        threads = _memory_budget()[1]
+
+    variables = _dask_variables(obj)
+
+    tasks = sum([int(np.prod(v.data.numblocks)) * len(v.data.dask.layers) for v in variables.values()])
+    bytes_to_read = sum([v.nbytes for v in variables.values()])
+    max_chunk_bytes = max([int(np.prod([max(c) for c in v.chunks])) * v.dtype.itemsize
+                           for v in variables.values()] or [0])
+
+    return {'tasks': tasks,
+            'bytes_to_read': bytes_to_read,
+            'max_chunk_bytes': max_chunk_bytes,
+            'peak_memory': threads * overhead * max_chunk_bytes}
+
+
+def _format_estimate(estimate):
+    return ('%d tasks, %.2f GB to read, %.1f MB largest chunk, %.2f GB peak memory per worker' %
+            (estimate['tasks'], estimate['bytes_to_read'] / 1e9,
+             estimate['max_chunk_bytes'] / 1e6, estimate['peak_memory'] / 1e9))
+
+
+def preflight(obj, max_memory=None, max_tasks=1e6, overhead=3, threads=None,
+              rechunk=True, time_name=None):
+    """
+    Check that a lazy computation fits on the workers before calling compute.
+
+    Task count, bytes to read and peak memory per worker are estimated from the chunks
+    (see estimate_cost). If the chunks are too large for the memory budget,
+    the time dimension is split into smaller chunks. If there are too many tasks,
+    time chunks are merged, as long as they still fit in memory.
+    If it still does not fit, a MemoryError with the estimate is raised,
+    instead of failing hours into the computation.
+
+    Input
+    -----
+    obj - Dataset or DataArray with dask arrays, e.g. from read_nemo
+    max_memory (optional) - Memory budget per worker in bytes.
+                            Default: from dask.distributed client, or memory of this machine
+    max_tasks (optional) - Largest number of tasks allowed (default: 1e6)
+    overhead (optional) - Temporaries per chunk, see estimate_cost (default: 3)
+    threads (optional) - Tasks running at the same time on a worker, see estimate_cost
+    rechunk (optional) - Adjust time chunks to fit the budget (True, default),
+                         or only check (False)
+    time_name (optional) - Name of time dimension. Default: time or time_counter
+
+    Output
+    ------
+    obj - Input, rechunked in time if needed
+
+    Example
+    -------
+    ds = preflight(read_nemo(['FOCI_GJK029'], [slice(None)], esm_dir, freq='5d')[0])
+    """
+
+    memory, _threads = _memory_budget()
+    max_memory = max_memory or memory
+    threads = threads or _threads
+
+    estimate = estimate_cost(obj, overhead=overhead, threads=threads)
+    if estimate['tasks'] == 0:
+        return obj
+
+    if time_name is None:
+        time_name = 'time' if 'time' in obj.dims else 'time_counter'
+    chunks = obj.chunksizes.get(time_name) if time_name in obj.dims else None
+
+    if rechunk and chunks:
+        chunk = max(chunks)
+
+        # smaller chunks to fit in memory
+        if estimate['peak_memory'] > max_memory:
+            factor = int(np.ceil(estimate['peak_memory'] / max_memory))
+            chunk = max(1, chunk // factor)
+
+        # larger chunks to reduce the number of tasks, while still fitting in memory
+        elif estimate['tasks'] > max_tasks:
+            factor = int(np.ceil(estimate['tasks'] / max_tasks))
+            fits = int(chunk * max_memory // estimate['peak_memory'])
+            chunk = min(chunk * factor, fits, obj.sizes[time_name])
+
+        if chunk != max(chunks):
+            print('preflight: %s. Rechunking %s from %d to %d' %
+                  (_format_estimate(estimate), time_name, max(chunks), chunk))
+            obj = obj.chunk({time_name: chunk})
+            estimate = estimate_cost(obj, overhead=overhead, threads=threads)
+
+    if estimate['peak_memory'] > max_memory or estimate['tasks'] > max_tasks:
+        raise MemoryError('Computation does not fit: %s. Budget is %.2f GB per worker and %d tasks. '
+                          'Use a smaller region or time period, or more memory per worker' %
+                          (_format_estimate(estimate), max_memory / 1e9, max_tasks))
+
+    return obj
+
+
+def enable_preflight(enabled=True):
+    """
+    Check the input of diagnostics with preflight (off by default).
+
+    When enabled, area_mean_nemo, seaice_areas, volume_integral_nemo, regrid_nemo,
+    compute_moc_sigma, compute_nino_index and compute_enso_indices run preflight
+    on their input, i.e. they may rechunk it in time, or raise MemoryError
+    before building a graph that does not fit.
+
+    Input
+    -----
+    enabled (optional) - True to check (default), False to stop checking
+    """
+
+    global _preflight_enabled
+    _preflight_enabled = enabled
+
+
+def maybe_preflight(obj, **kwargs):
+    """
+    Run preflight on obj if it has been enabled with enable_preflight,
+    otherwise return obj as it is. kwargs are passed on to preflight
+    """
+
+    if not _preflight_enabled:
+        return obj
+
+    return preflight(obj, **kwargs)
@@ -0,0 +1,193 @@
+import xarray as xr
+from focitools import climate_indices
+from focitools import graph_checks
+
+
+def _parse_diagnostic(diagnostic):
+    """
+    Split e.g. 'area_mean_nemo:sosstsst' into ('area_mean_nemo', ['sosstsst'])
+    """
+
+    name, _, args = diagnostic.partition(':')
+    args = [a.strip() for a in args.split(',') if a.strip()]
+
+    return name.strip(), args
+
+
+def compute_diagnostics(diagnostics, ds, areacello=None, mask=None,
+                        sicname='ileadfra', sitname='iicethic', sstname='sosstsst',
+                        lonname='nav_lon', latname='nav_lat', xname='x', yname='y',
+                        time_name='time', max_memory=None):
+    """
+    Compute several diagnostics from one dataset with a single pass over the data.
+
+    Calling seaice_areas, ice_volumes, area_mean_nemo, compute_enso_indices etc one by one
+    reads the input variables once per diagnostic, and rebuilds masks and weights each time.
+    Here all diagnostics are planned first: each input variable is taken once,
+    shared masks and weights (hemispheres, ocean mask, ice edge) are made once,
+    and all outputs are put in one graph which is computed with one .compute().
+    If max_memory is given (or preflight is enabled, see enable_preflight), the input
+    variables are checked with preflight first, and rechunked in time if needed.
+
+    Input
+    -----
+    diagnostics - List of diagnostics. Available:
+                  'seaice_areas' - ar_sia, an_sia, ar_sie, an_sie as in seaice_areas
+                  'ice_volumes' - ar_siv, an_siv, ar_sit, an_sit as in ice_volumes
+                  'area_mean_nemo:<var>' - area mean of <var> as in area_mean_nemo,
+                                           named <var>_mean. Several vars can be given,
+                                           e.g. 'area_mean_nemo:sosstsst,sosaline'
+                  'compute_enso_indices' - ENSO indices as in compute_enso_indices.
+                                           Indices can be given, e.g. 'compute_enso_indices:NINO3.4,ONI'
+    ds - Dataset with all input variables, e.g. from read_nemo (merged grid_T and icemod)
+    areacello (optional) - Area of ocean cells. Needed for all but compute_enso_indices,
+                           which uses cos(lat) if it is not given
+    mask (optional) - Land-sea mask where 1 is ocean, e.g. tmask at surface.
+                      Used for area_mean_nemo. Default: all points
+    sicname (optional) - Name of sea-ice concentration (default: ileadfra)
+    sitname (optional) - Name of cell-averaged ice thickness (default: iicethic)
+    sstname (optional) - Name of SST for ENSO indices (default: sosstsst)
+    lonname (optional) - Name of longitude (default: nav_lon)
+    latname (optional) - Name of latitude (default: nav_lat)
+    xname (optional) - Name of x dimension (default: x)
+    yname (optional) - Name of y dimension (default: y)
+    time_name (optional) - Name of time dimension (default: time)
+    max_memory (optional) - Memory budget per worker in bytes, see preflight.
+                            Default: None, i.e. no check unless preflight is enabled
+
+    Output
+    ------
+    ds_diag - Dataset with outputs from all diagnostics
+
+    Example
+    -------
+    ds_diag = compute_diagnostics(['seaice_areas', 'ice_volumes', 'area_mean_nemo:sosstsst',
+                                   'compute_enso_indices:NINO3.4'],
+                                  ds, areacello=ds_mesh['areacello'], mask=ds_mesh['tmask'].isel(deptht=0))
+    """
+
+    dims = [xname, yname]
+
+    # Only keep the variables we need, and check that they fit in memory if asked
+    needed = [v for v in (lonname, latname) if v in ds.data_vars]
+    for diagnostic in diagnostics:
+        name, args = _parse_diagnostic(diagnostic)
+        needed += {'seaice_areas': [sicname],
+                   'ice_volumes': [sicname, sitname],
+                   'area_mean_nemo': args,
+                   'compute_enso_indices': [sstname],
+                   'compute_nino_index': [sstname]}.get(name, [])
+    ds = ds[list(dict.fromkeys(needed))]
+    if max_memory is not None:
+        ds = graph_checks.preflight(ds, max_memory=max_memory, time_name=time_name)
+    else:
+        ds = graph_checks.maybe_preflight(ds, time_name=time_name)
+
+    # Intermediate results (variables, masks, weights) shared by all diagnostics.
+    # Each is made the first time it is needed, and then reused
+    shared = {}
+    def get(key, make):
+        if key not in shared:
+            shared[key] = make()
+        return shared[key]
+
+    # Input variables, each taken once
+    def var(name):
+        return get(('var', name), lambda: ds[name])
+
+    # Cell area as a static array, 0 where undefined
+    def area():
+        def make():
+            if areacello is None:
+                raise ValueError('areacello is needed for %s' % (diagnostics,))
+            return areacello.fillna(0).compute()
+        return get('area', make)
+
+    # Area of each hemisphere, so both are computed in one reduction
+    def hemispheres():
+        def make():
+            lat = ds[latname].compute()
+            return xr.concat([area().where(lat > 0, 0), area().where(lat < 0, 0)],
+                             dim=xr.DataArray(['ar', 'an'], dims='hemisphere', name='hemisphere'))
+        return get('hemispheres', make)
+
+    def hemisphere_sum(data):
+        return xr.dot(data.fillna(0), hemispheres(), dim=dims)
+
+    # sea ice
+    def ice_conc():
+        return var(sicname)
+
+    def ice_edge():
+        return get('ice_edge', lambda: ice_conc() >= 0.15)
+
+    # ocean mask for area means
+    def ocean_area():
+        def make():
+            if mask is None:
+                return area()
+            return area().where(mask.compute() == 1, 0)
+        return get('ocean_area', make)
+
+    outputs = {}
+    enso_indices = None
+
+    for diagnostic in diagnostics:
+        name, args = _parse_diagnostic(diagnostic)
+
+        if name == 'seaice_areas':
+            # scale from m2 to million km2
+            icescale = 1e-12
+            sia = hemisphere_sum(ice_conc()) * icescale
+            sie = hemisphere_sum(ice_conc().where(ice_conc() > 0.15)) * icescale
+            for h in ['ar', 'an']:
+                outputs[h+'_sia'] = sia.sel(hemisphere=h, drop=True)
+                outputs[h+'_sie'] = sie.sel(hemisphere=h, drop=True)
+
+        elif name == 'ice_volumes':
+            # scale from m3 to km3
+            icescale = 1e-9
+            sit = var(sitname)
+            siv = hemisphere_sum(sit) * icescale
+
+            # area-mean ice thickness where concentration >= 0.15
+            thk = sit.where(ice_edge())
+            thk_mean = hemisphere_sum(thk) / hemisphere_sum(thk.notnull())
+            for h in ['ar', 'an']:
+                outputs[h+'_siv'] = siv.sel(hemisphere=h, drop=True)
+                outputs[h+'_sit'] = thk_mean.sel(hemisphere=h, drop=True)
+
+        elif name == 'area_mean_nemo':
+            if not args:
+                raise ValueError('area_mean_nemo needs a variable, e.g. area_mean_nemo:sosstsst')
+            for v in args:
+                data = var(v)
+                outputs[v+'_mean'] = (xr.dot(data.fillna(0), ocean_area(), dim=dims) /
+                                      xr.dot(data.notnull(), ocean_area(), dim=dims))
+
+        elif name in ['compute_enso_indices', 'compute_nino_index']:
+            enso_indices = (enso_indices or []) + (args or ['NINO1+2', 'NINO3', 'NINO3.4',
+                                                            'NINO4', 'ONI', 'TNI'])
+            enso_indices = list(dict.fromkeys(enso_indices))
+
+        else:
+            raise ValueError('Unknown diagnostic: %s' % (diagnostic,))
+
+    # Area sums for ENSO are computed together with everything else,
+    # and the indices are made from them afterwards
+    if enso_indices is not None:
+        box_sums = climate_indices._enso_box_sums(var(sstname), enso_indices, time_name=time_name,
+                                                  lon_name=lonname, lat_name=latname,
+                                                  areacello=areacello)
+        outputs['_enso_sum'] = box_sums['sum']
+        outputs['_enso_wgt'] = box_sums['wgt']
+
+    # One compute for all diagnostics
+    ds_diag = xr.Dataset(outputs).compute()
+
+    if enso_indices is not None:
+        box_sums = xr.Dataset({'sum': ds_diag['_enso_sum'], 'wgt': ds_diag['_enso_wgt']})
+        ds_enso = climate_indices._enso_from_box_sums(box_sums, enso_indices, time_name=time_name)
+        ds_diag = xr.merge([ds_diag.drop_vars(['_enso_sum', '_enso_wgt', 'box']), ds_enso])
+
+    return ds_diag
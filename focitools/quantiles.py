@@ -0,0 +1,169 @@
+import numpy as np
+import xarray as xr
+
+
+def _histogram_block(x, edges):
+    """
+    Histogram for each grid point of one block (time, ...).
+    Bin 0 is below edges[0], bin len(edges) is above edges[-1]
+    """
+
+    nbins = len(edges) + 1
+    ncell = int(np.prod(x.shape[1:]))
+    flat = x.reshape(x.shape[0], ncell)
+
+    valid = np.isfinite(flat)
+    index = np.searchsorted(edges, flat, side='right') * ncell + np.arange(ncell)
+
+    counts = np.bincount(index[valid], minlength=nbins * ncell).astype(np.int32)
+
+    return counts.reshape((1, nbins) + x.shape[1:])
+
+
+def gridpoint_histograms(data, edges=None, nbins=200, value_range=None, time_name='time'):
+    """
+    Count values in fixed bins for each grid point, streaming over time chunks.
+
+    Each time chunk gives one histogram per grid point (vectorized with bincount),
+    and the histograms of all chunks are added, so the histograms can be
+    built on many dask workers and the full time series is never sorted or held.
+    Memory is proportional to grid size times number of bins.
+
+    Input
+    -----
+    data - DataArray with time dimension, e.g. daily 2m temperature from read_openifs
+    edges (optional) - Bin edges, e.g. np.arange(-50, 50.1, 0.1) or log-spaced for precipitation
+    nbins (optional) - Number of equal bins between min and max, used if edges is not given (default: 200)
+    value_range (optional) - (min, max) used with nbins. Default: min and max of data (one extra pass)
+    time_name (optional) - Name of time dimension (default: time)
+
+    Output
+    ------
+    hist - DataArray (bin, ...) with counts (int32). Coordinates bin_lower and bin_upper
+           give the bin edges. The first and last bins count values below and above the edges
+    """
+
+    import dask.array as da
+
+    if edges is None:
+        if value_range is None:
+            value_range = [float(v) for v in da.compute(data.min(), data.max())]
+        edges = np.linspace(value_range[0], value_range[1], nbins + 1)
+    edges = np.asarray(edges, dtype=np.float64)
+
+    space_dims = [d for d in data.dims if d != time_name]
+    data = data.transpose(time_name, *space_dims)
+
+    arr = data.data
+    if not isinstance(arr, da.Array):
+        arr = da.from_array(arr, chunks={0: 'auto'})
+
+    # one histogram per time chunk, then added
+    chunks = ((1,) * len(arr.chunks[0]), (len(edges) + 1,)) + arr.chunks[1:]
+    counts = arr.map_blocks(_histogram_block, edges, chunks=chunks, new_axis=1, dtype=np.int32)
+    counts = counts.sum(axis=0, dtype=np.int32)
+
+    coords = {c: data[c] for c in data.coords if set(data[c].dims).issubset(space_dims)}
+    hist = xr.DataArray(counts, dims=['bin'] + space_dims, coords=coords)
+    hist = hist.assign_coords(bin_lower=('bin', np.concatenate([[-np.inf], edges])),
+                              bin_upper=('bin', np.concatenate([edges, [np.inf]])))
+    hist.name = 'histogram'
+
+    return hist
+
+
+def histogram_quantiles(hist, q):
+    """
+    Approximate quantiles for each grid point from gridpoint_histograms.
+
+    The quantile is interpolated linearly within the bin that contains it,
+    so the error is at most the width of that bin, compared with the inverse of the
+    empirical distribution (numpy.quantile with method='inverted_cdf').
+    Other quantile definitions can differ by the spacing of neighbouring values,
+    which matters far out in the tail of short records.
+    Quantiles that fall below or above the bin edges are NaN.
+
+    Input
+    -----
+    hist - Output from gridpoint_histograms (computed or lazy)
+    q - Quantile or list of quantiles in [0, 1], e.g. [0.9, 0.99]
+
+    Output
+    ------
+    ds - Dataset with
+         quantiles - DataArray (quantile, ...)
+         error_bound - Width of the bin each quantile is in, i.e. the largest possible error
+    """
+
+    q = np.atleast_1d(np.asarray(q, dtype=np.float64))
+    hist = hist.load()
+
+    counts = hist.values.astype(np.int64)
+    lower = hist['bin_lower'].values.reshape((-1,) + (1,) * (counts.ndim - 1))
+    upper = hist['bin_upper'].values.reshape((-1,) + (1,) * (counts.ndim - 1))
+
+    cum = np.cumsum(counts, axis=0)
+    total = cum[-1]
+
+    values = []
+    errors = []
+    for qi in q:
+        target = qi * total
+
+        # first bin where cumulative count reaches target
+        k = np.argmax(cum >= target, axis=0)[None]
+        before = np.take_along_axis(cum, k, axis=0) - np.take_along_axis(counts, k, axis=0)
+        n = np.take_along_axis(counts, k, axis=0)
+        lo = np.take_along_axis(np.broadcast_to(lower, counts.shape), k, axis=0)
+        hi = np.take_along_axis(np.broadcast_to(upper, counts.shape), k, axis=0)
+
+        with np.errstate(invalid='ignore', divide='ignore'):
+            frac = np.where(n > 0, (target - before) / n, 0.0)
+            value = lo + frac * (hi - lo)
+
+        # outside the edges, or no data
+        bad = ~np.isfinite(lo) | ~np.isfinite(hi) | (total == 0)
+        values.append(np.where(bad, np.nan, value)[0])
+        errors.append(np.where(bad, np.nan, hi - lo)[0])
+
+    dims = ['quantile'] + list(hist.dims[1:])
+    coords = {c: hist[c] for c in hist.coords if 'bin' not in hist[c].dims}
+    coords['quantile'] = q
+
+    ds = xr.Dataset({'quantiles': xr.DataArray(np.array(values), dims=dims, coords=coords),
+                     'error_bound': xr.DataArray(np.array(errors), dims=dims, coords=coords)})
+
+    return ds
+
+
+def exceedance_counts(hist, threshold):
+    """
+    Approximate number of values above a threshold for each grid point,
+    e.g. number of days above the 90th percentile of a base period (TX90p).
+
+    Exact when threshold is a bin edge. Otherwise the bin that contains threshold
+    is assumed to be evenly filled, so the error is at most the count in that bin.
+
+    Input
+    -----
+    hist - Output from gridpoint_histograms
+    threshold - Number, or DataArray with a threshold for each grid point,
+                e.g. quantiles from histogram_quantiles for a base period
+
+    Output
+    ------
+    count - DataArray with number of values above threshold
+    """
+
+    lower, upper = hist['bin_lower'], hist['bin_upper']
+
+    # fraction of each bin above threshold
+    with np.errstate(invalid='ignore', divide='ignore'):
+        frac = ((upper - threshold) / (upper - lower)).clip(0, 1)
+    frac = xr.where(lower >= threshold, 1.0, xr.where(upper <= threshold, 0.0, frac.fillna(0.5)))
+
+    count = (hist * frac).sum('bin')
+    count = count.drop_vars(['bin_lower', 'bin_upper'], errors='ignore')
+    count.name = 'exceedance_count'
+
+    return count
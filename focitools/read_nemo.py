@@ -1,9 +1,134 @@
 import xarray as xr
 import cftime
 from focitools import functions
+from focitools import analysis_store
+from focitools import regions
+
+def nemo_files(exp, esm_dir, grid='grid_T', freq='1m', agrif_prefix=''):
+    """
+    File pattern for NEMO output from one experiment, e.g. 
+    esm_dir/exp/outdata/nemo/exp*1m*grid_T.nc
+    """
+    
+    # Note: In case of AGRIF, all files will have a prefix of 1_ or 2_ 
+    if freq == '1y':
+        files = '%s/%s/outdata/nemo/ym/%s%s*1y*%s.nc' % (esm_dir,exp,agrif_prefix,exp,grid)
+    else:
+        files = '%s/%s/outdata/nemo/%s%s*%s*%s.nc' % (esm_dir,exp,agrif_prefix,exp,freq,grid)
+    
+    return files
+
+
+# Output frequencies from coarse to fine
+_freq_order = ['1y', '1m', '5d', '1d', '6h', '3h', '1h']
+
+
+# Time steps per day for output finer than monthly
+_steps_per_day = {'5d': 1/5., '1d': 1., '6h': 4., '3h': 8., '1h': 24.}
+
+
+def _covered_periods(files, time, aggregate, freq, chunks):
+    """
+    Complete periods (years or months) with data in files within time slice. 
+    
+    A period is complete if it has 12 months (for yearly means from monthly files), 
+    or as many time steps as fit in the period (for 5d, daily or hourly files). 
+    
+    Output
+    ------
+    complete - Set of labels of complete periods
+    partial - Set of labels of periods that only have some of the data
+    """
+    
+    import numpy as np
+    
+    if not functions.resolve_files(files):
+        return set(), set()
+    
+    _ds = functions.open_multifile_dataset(files, chunks=chunks)
+    times = _ds['time_counter'].sel(time_counter=time).values
+    if len(times) == 0:
+        return set(), set()
+    
+    labels = functions.time_periods(times, freq=aggregate)
+    periods, counts = np.unique(labels, return_counts=True)
+    
+    if freq == aggregate:
+        expected = np.ones(len(periods))
+    elif freq == '1m':
+        # yearly means from monthly data
+        months = np.unique(functions.time_periods(times, freq='1m'))
+        counts = np.array([np.sum(months // 100 == year) for year in periods])
+        expected = 12 * np.ones(len(periods))
+    elif freq in _steps_per_day:
+        days = functions.period_days(periods, freq=aggregate, calendar=times[0].calendar)
+        expected = np.floor(days * _steps_per_day[freq] + 1e-6)
+    else:
+        # unknown frequency, so assume all periods are complete
+        expected = np.zeros(len(periods))
+    
+    complete = set(periods[counts >= expected].tolist())
+    partial = set(periods.tolist()) - complete
+    
+    return complete, partial
+
+
+def plan_aggregation(exp, time, esm_dir, aggregate, grid='grid_T', freq='1m', agrif_prefix='', 
+                     chunks=None):
+    """
+    Find the best output frequency to read to get aggregate means. 
+    
+    Pre-aggregated files (1y in ym/, or 1m) are used if they exist and have 
+    complete periods (e.g. all 12 months of a year) for all periods in time. 
+    Otherwise, or if freq only has part of a period in time (so the pre-aggregated 
+    mean would not be the mean of the data), freq is used and has to be downsampled. 
+    
+    Input
+    -----
+    exp - Experiment ID
+    time - Time slice to read
+    esm_dir - Directory to experiments
+    aggregate - '1y' or '1m'
+    grid (optional) - e.g. grid_T. Default: grid_T
+    freq (optional) - Frequency to use if no pre-aggregated files are found. Default: 1m
+    agrif_prefix (optional) - Prefix for AGRIF files. Default: empty string
+    chunks (optional) - Chunks used when opening files
+    
+    Output
+    ------
+    freq - Frequency to read. If this is not aggregate, the data should be downsampled
+    """
+    
+    if aggregate not in ['1y', '1m']:
+        raise ValueError("aggregate must be '1y' or '1m', not %s" % (aggregate,))
+    
+    order = _freq_order.index(freq) if freq in _freq_order else len(_freq_order)
+    if _freq_order.index(aggregate) > order:
+        raise ValueError('Cannot aggregate %s output to %s means' % (freq, aggregate))
+    
+    candidates = [f for f in ['1y', '1m'] 
+                  if _freq_order.index(aggregate) <= _freq_order.index(f) < order]
+    if not candidates:
+        return freq
+    
+    # periods that the full-resolution files cover
+    files = nemo_files(exp, esm_dir, grid=grid, freq=freq, agrif_prefix=agrif_prefix)
+    needed, partial = _covered_periods(files, time, aggregate, freq, chunks)
+    if partial:
+        return freq
+    
+    for candidate in candidates:
+        files = nemo_files(exp, esm_dir, grid=grid, freq=candidate, agrif_prefix=agrif_prefix)
+        available, _ = _covered_periods(files, time, aggregate, candidate, chunks)
+        if available and needed.issubset(available):
+            return candidate
+    
+    return freq
+
 
 def read_nemo(exp_list, time_list, esm_dir, 
-              grid='grid_T', freq='1m', agrif_prefix='', decode_timedelta=True):
+              grid='grid_T', freq='1m', agrif_prefix='', decode_timedelta=True, 
+              store_dir=None, region=None, aggregate=None):
     """
     Read output from NEMO
 
@@ -19,6 +144,17 @@ def read_nemo(exp_list, time_list, esm_dir,
     freq - e.g. 1m, 5d. Default: 1m
     decode_timedelta - Decode time differences (True) or not (False). Default: True
     agrif_prefix - Prefix for AGRIF files, e.g. 1_. Default: empty string
+    store_dir - Directory with analysis stores (see convert_to_analysis_store). 
+                If a store for the experiment exists and is up to date, it is read 
+                instead of the netCDF files. Default: None
+    region - Only read the smallest hyperslab containing a region, 
+             given as a dictionary with lon_range and lat_range, or polygon, 
+             e.g. {'lon_range':(190,240), 'lat_range':(-5,5)}. See region_bounds. 
+             Points in the hyperslab but outside the region are kept. Default: None
+    aggregate - Return yearly ('1y') or monthly ('1m') means. Pre-aggregated files 
+                are read if they exist and cover time (see plan_aggregation), 
+                otherwise freq is read and downsampled blockwise (see downsample). 
+                Default: None
 
     Output
     ------
@@ -37,17 +173,36 @@ def read_nemo(exp_list, time_list, esm_dir,
     # list for all data
     ds_all = []
     for exp,time in zip(exp_list,time_list):
-
-        # Note: In case of AGRIF, all files will have a prefix of 1_ or 2_ 
-        if freq == '1y':
-            files = '%s/%s/outdata/nemo/ym/%s%s*1y*%s.nc' % (esm_dir,exp,agrif_prefix,exp,grid)
-        else:
-            files = '%s/%s/outdata/nemo/%s%s*%s*%s.nc' % (esm_dir,exp,agrif_prefix,exp,freq,grid)
+        
+        # find which files to read for aggregated means
+        _freq = freq
+        if aggregate is not None:
+            _freq = plan_aggregation(exp, time, esm_dir, aggregate, grid=grid, freq=freq, 
+                                     agrif_prefix=agrif_prefix, chunks=chunks)
+        
+        files = nemo_files(exp, esm_dir, grid=grid, freq=_freq, agrif_prefix=agrif_prefix)
         print(files)
-
+        
+        # use analysis store if there is one
+        _ds = None
+        if store_dir is not None:
+            store = analysis_store.analysis_store_path(store_dir, exp, 'nemo', agrif_prefix+grid, _freq)
+            _ds = analysis_store.open_analysis_store(store, source_files=files)
+        
         # use function to read multi-file data set
         # Will use cftime, read in parallel, etc. 
-        ds = functions.open_multifile_dataset(files, chunks=chunks).rename({'time_counter':'time'}).sel(time=time)
+        if _ds is None:
+            _ds = functions.open_multifile_dataset(files, chunks=chunks)
+        
+        # only read the part of the grid we need
+        if region is not None:
+            _ds = _ds.isel(regions.region_bounds(_ds['nav_lon'], _ds['nav_lat'], **region))
+        
+        ds = _ds.rename({'time_counter':'time'}).sel(time=time)
+        
+        # no pre-aggregated files, so compute means while reading
+        if aggregate is not None and _freq != aggregate:
+            ds = functions.downsample(ds, freq=aggregate)
         
         ds_all.append(ds)
         
@@ -18,6 +18,10 @@ def read_nemo_mesh(mesh_mask_file):
     # but the grid_T files have "deptht" etc so we need to rename
     ds_mesh = xr.open_dataset(mesh_mask_file)
     
+    # lon lat of T and F points (F points are the cell corners of T cells)
+    glamt, gphit = ds_mesh['glamt'].squeeze(), ds_mesh['gphit'].squeeze()
+    glamf, gphif = ds_mesh['glamf'].squeeze(), ds_mesh['gphif'].squeeze()
+    
     # dx dy
     dxt, dyt = ds_mesh['e1t'].squeeze(), ds_mesh['e2t'].squeeze()
     dxu, dyu = ds_mesh['e1u'].squeeze(), ds_mesh['e2u'].squeeze()
@@ -68,6 +72,11 @@ def read_nemo_mesh(mesh_mask_file):
     gdept = ds_mesh['gdept_0'].rename({'z':'deptht'})
     gdepu = ds_mesh['gdepu'].rename({'z':'depthu'})
     gdepv = ds_mesh['gdepv'].rename({'z':'depthv'})
+    gdept.name = 'gdept'
+    
+    # reference (1D) depth of top of T cells and thickness of T cells
+    gdepw_1d = ds_mesh['gdepw_1d'].rename({'z':'deptht'}).squeeze()
+    e3t_1d = ds_mesh['e3t_1d'].rename({'z':'deptht'}).squeeze()
     
     # compute depth as 2D fields
     # mask land, then take max values for each x,y cell
@@ -79,10 +88,13 @@ def read_nemo_mesh(mesh_mask_file):
     deptho_v.name = 'deptho_v'
     
     ds = xr.merge([areacello, areacello_u, areacello_v, 
-                   dxt, dyt, 
+                   glamt, gphit, glamf, gphif, 
+                   dxt, dyt, dxu, dyu, dxv, dyv, 
                    dzt, dzu, dzv, 
                    volcello, masscello, 
                    deptho, deptho_u, deptho_v,
+                   gdept.squeeze(), 
+                   gdepw_1d, e3t_1d, 
                    tmask, umask, vmask])
     
     return ds
@@ -103,10 +115,14 @@ def compute_dz_tilde(ssh, dz0, depth0, areacello):
     dz0 - x,y,z field with thickness assuming ssh=0
     depth0 - x,y field with depth assuming ssh=0
     areacella - x,y field with cell area
+    
+    Note: this returns full t,z,y,x fields which can be very large for long runs. 
+    For volume or mass integrals, use volume_integral_nemo with ssh and depth0 instead, 
+    which applies the stretching factor (see vvl_scale_factor) to each column. 
     """
     
     # Taken from NEMO code
-    dz = dz0 * (1.0 + ssh/depth0)
+    dz = dz0 * vvl_scale_factor(ssh, depth0)
     
     # Compute masscello
     masscello = dz * 1026.0 # [kg/m2]
@@ -115,4 +131,23 @@ def compute_dz_tilde(ssh, dz0, depth0, areacello):
     volcello = areacello * dz
     
     return dz, volcello, masscello
-    
\ No newline at end of file
+
+
+def vvl_scale_factor(ssh, depth0):
+    """
+    Compute the factor that stretches cell thickness in runs with vvl, 
+    i.e. dz = dz0 * (1 + ssh/depth0)
+    
+    The factor is the same for all levels in a column, so this is an x,y,t field. 
+    
+    Input
+    ssh - x,y,t field with ssh
+    depth0 - x,y field with depth assuming ssh=0
+    """
+    
+    # Avoid division by zero on land
+    stretch = 1.0 + ssh / depth0.where(depth0 > 0)
+    stretch = stretch.fillna(1.0)
+    stretch.name = 'vvl_scale_factor'
+    
+    return stretch
@@ -1,4 +1,19 @@
-def read_openifs(exp_list, time_list, esm_dir, grid='regular_sfc', freq='1m', chunk_grid='O96'):
+def openifs_files(exp, esm_dir, grid='regular_sfc', freq='1m'):
+    """
+    File pattern for OpenIFS output from one experiment, e.g. 
+    esm_dir/exp/outdata/oifs/exp*1m*regular_sfc.nc
+    """
+    
+    if freq == '1y':
+        files = '%s/%s/outdata/oifs/ym/%s*1y*%s.nc' % (esm_dir,exp,exp,grid)
+    else:
+        files = '%s/%s/outdata/oifs/%s*%s*%s.nc' % (esm_dir,exp,exp,freq,grid)
+    
+    return files
+
+
+def read_openifs(exp_list, time_list, esm_dir, grid='regular_sfc', freq='1m', chunk_grid='O96', 
+                 store_dir=None, region=None):
     """
     Function to read OpenIFS data. 
 
@@ -11,6 +26,12 @@ def read_openifs(exp_list, time_list, esm_dir, grid='regular_sfc', freq='1m', ch
     freq (optional) - What time frequency of data to read, e.g. 5d, 1m (default), 1y
     chunk_grid (optional) - Chunking settings. Defaults to O96 which only chunks
                             along the time dimension
+    store_dir (optional) - Directory with analysis stores (see convert_to_analysis_store). 
+                           If a store for the experiment exists and is up to date, it is read 
+                           instead of the netCDF files. Default: None
+    region (optional) - Only read the smallest lon/lat box containing a region, 
+                        given as a dictionary with lon_range and lat_range, or polygon, 
+                        e.g. {'lon_range':(190,240), 'lat_range':(-5,5)}. Default: None
 
     Output
     ------
@@ -21,6 +42,8 @@ def read_openifs(exp_list, time_list, esm_dir, grid='regular_sfc', freq='1m', ch
     import xarray as xr
     import cftime 
     from focitools import functions
+    from focitools import analysis_store
+    from focitools import regions
 
     if chunk_grid == 'O96':
         # check if sfc is part of the grid, i.e. we are looking at surface 2D fields
@@ -33,14 +56,22 @@ def read_openifs(exp_list, time_list, esm_dir, grid='regular_sfc', freq='1m', ch
     ds_all = []
     for exp,time in zip(exp_list,time_list):
         
-        if freq == '1y':
-            files = '%s/%s/outdata/oifs/ym/%s*1y*%s.nc' % (esm_dir,exp,exp,grid)
-        else:
-            files = '%s/%s/outdata/oifs/%s*%s*%s.nc' % (esm_dir,exp,exp,freq,grid)
+        files = openifs_files(exp, esm_dir, grid=grid, freq=freq)
         print(files)
+        
+        # use analysis store if there is one
+        _ds = None
+        if store_dir is not None:
+            store = analysis_store.analysis_store_path(store_dir, exp, 'oifs', grid, freq)
+            _ds = analysis_store.open_analysis_store(store, source_files=files)
+        
+        if _ds is None:
+            _ds = functions.open_multifile_dataset(files, chunks=chunks)
 
-        _ds = functions.open_multifile_dataset(files, chunks=chunks)
-
+        # only read the part of the grid we need
+        if region is not None:
+            _ds = _ds.isel(regions.region_bounds(_ds['lon'], _ds['lat'], **region))
+        
         # rename time_counter to time
         ds = _ds.rename({'time_counter':'time'}).sel(time=time)
         
@@ -0,0 +1,201 @@
+import hashlib
+import numpy as np
+import xarray as xr
+
+# Index bounds that have already been computed, for each grid and region
+_bounds_cache = {}
+
+
+def _grid_key(lon, lat):
+    """
+    Hash of grid coordinates, so index bounds are only computed once per grid
+    """
+
+    h = hashlib.sha1()
+    for c in [lon, lat]:
+        h.update(str(c.shape).encode())
+        h.update(np.ascontiguousarray(c, dtype=np.float64).tobytes())
+
+    return h.hexdigest()
+
+
+def _in_lon_range(lon, lon_range):
+    """
+    True where lon is in lon_range = (west, east).
+    Handles any longitude convention, e.g. (190, 240) is the same as (-170, -120),
+    and ranges crossing the dateline, e.g. (170, -170).
+    """
+
+    west, east = lon_range
+    width = (east - west) % 360.0
+    if width == 0 and east != west:
+        width = 360.0
+
+    return (lon - west) % 360.0 <= width
+
+
+def _in_polygon(lon, lat, polygon):
+    """
+    True where (lon, lat) is inside polygon (list of (lon, lat) vertices).
+    Uses the even-odd (ray casting) rule. Polygon longitudes should use the same
+    convention as lon and should not cross the dateline.
+    """
+
+    poly = np.asarray(polygon, dtype=np.float64)
+    px, py = poly[:, 0], poly[:, 1]
+    qx, qy = np.roll(px, -1), np.roll(py, -1)
+
+    inside = np.zeros(lon.shape, dtype=bool)
+    for x0, y0, x1, y1 in zip(px, py, qx, qy):
+        crosses = (y0 > lat) != (y1 > lat)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            xcross = x0 + (lat - y0) * (x1 - x0) / (y1 - y0)
+        inside ^= crosses & (lon < xcross)
+
+    return inside
+
+
+def region_mask(lon, lat, lon_range=None, lat_range=None, polygon=None):
+    """
+    Compute a mask which is True inside a lon/lat box or polygon
+
+    Input
+    -----
+    lon - Longitudes, 2D (e.g. nav_lon) or 1D
+    lat - Latitudes, 2D (e.g. nav_lat) or 1D
+    lon_range (optional) - (west, east) longitudes of box, e.g. (190, 240)
+    lat_range (optional) - (south, north) latitudes of box, e.g. (-5, 5)
+    polygon (optional) - List of (lon, lat) vertices, used instead of the box
+
+    Output
+    ------
+    mask - numpy array, True inside region. 2D (y, x) or (lat, lon) for 1D coordinates
+    """
+
+    lon = np.asarray(lon, dtype=np.float64)
+    lat = np.asarray(lat, dtype=np.float64)
+
+    # 1D coordinates on regular grids
+    if lon.ndim == 1:
+        lon, lat = np.meshgrid(lon, lat)
+
+    mask = np.ones(lon.shape, dtype=bool)
+
+    if polygon is not None:
+        mask &= _in_polygon(lon, lat, polygon)
+
+    else:
+        if lon_range is not None:
+            mask &= _in_lon_range(lon, lon_range)
+        if lat_range is not None:
+            mask &= (lat >= min(lat_range)) & (lat <= max(lat_range))
+
+    return mask
+
+
+def region_bounds(lon, lat, lon_range=None, lat_range=None, polygon=None,
+                  x_name=None, y_name=None):
+    """
+    Find the smallest (i, j) hyperslab that contains a lon/lat box or polygon.
+
+    On the curvilinear NEMO grid one can not use .sel with lon/lat,
+    so instead we find the index bounds once per grid and region,
+    and use .isel. The bounds are cached, so later calls are instant.
+    Using the bounds on a lazy dataset (e.g. from read_nemo) means
+    only the hyperslab is read from file.
+
+    Input
+    -----
+    lon - Longitudes, 2D (e.g. nav_lon) or 1D
+    lat - Latitudes, 2D (e.g. nav_lat) or 1D
+    lon_range (optional) - (west, east) longitudes of box, e.g. (190, 240)
+    lat_range (optional) - (south, north) latitudes of box, e.g. (-5, 5)
+    polygon (optional) - List of (lon, lat) vertices, used instead of the box
+    x_name (optional) - Name of x dimension. Default: from lon
+    y_name (optional) - Name of y dimension. Default: from lat
+
+    Output
+    ------
+    bounds - Dictionary with slices for each dimension, e.g. {'y':slice(200,230), 'x':slice(400,510)}
+             Use as ds.isel(bounds)
+    """
+
+    # dimension names
+    if isinstance(lon, xr.DataArray):
+        if lon.ndim == 1:
+            x_name = x_name or lon.dims[0]
+            y_name = y_name or lat.dims[0]
+        else:
+            y_name = y_name or lon.dims[0]
+            x_name = x_name or lon.dims[1]
+    x_name = x_name or 'x'
+    y_name = y_name or 'y'
+
+    lon = np.asarray(lon, dtype=np.float64)
+    lat = np.asarray(lat, dtype=np.float64)
+
+    # Make key for this grid and region
+    region = (None if lon_range is None else tuple(lon_range),
+              None if lat_range is None else tuple(lat_range),
+              None if polygon is None else tuple(map(tuple, polygon)))
+    key = (_grid_key(lon, lat), region, x_name, y_name)
+
+    if key in _bounds_cache:
+        return _bounds_cache[key]
+
+    mask = region_mask(lon, lat, lon_range=lon_range, lat_range=lat_range, polygon=polygon)
+
+    if not mask.any():
+        raise ValueError('No grid points found in region lon=%s, lat=%s, polygon=%s' % region)
+
+    jj, ii = np.where(mask)
+    bounds = {y_name: slice(int(jj.min()), int(jj.max()) + 1),
+              x_name: slice(int(ii.min()), int(ii.max()) + 1)}
+
+    _bounds_cache[key] = bounds
+
+    return bounds
+
+
+def subset_region(ds, lon_range=None, lat_range=None, polygon=None,
+                  lon_name='nav_lon', lat_name='nav_lat', mask=True):
+    """
+    Select the smallest hyperslab of ds that contains a lon/lat box or polygon.
+
+    Input
+    -----
+    ds - Dataset or DataArray, e.g. from read_nemo or read_openifs
+    lon_range (optional) - (west, east) longitudes of box, e.g. (190, 240)
+    lat_range (optional) - (south, north) latitudes of box, e.g. (-5, 5)
+    polygon (optional) - List of (lon, lat) vertices, used instead of the box
+    lon_name (optional) - Name of longitude (default: nav_lon)
+    lat_name (optional) - Name of latitude (default: nav_lat)
+    mask (optional) - Set points in the hyperslab but outside the region to NaN (default: True)
+
+    Output
+    ------
+    ds_region - Subset of ds
+    """
+
+    bounds = region_bounds(ds[lon_name], ds[lat_name], lon_range=lon_range,
+                           lat_range=lat_range, polygon=polygon)
+    ds_region = ds.isel(bounds)
+
+    if mask:
+        inside = region_mask(ds_region[lon_name], ds_region[lat_name], lon_range=lon_range,
+                             lat_range=lat_range, polygon=polygon)
+        if ds_region[lon_name].ndim == 1:
+            dims = (ds_region[lat_name].dims[0], ds_region[lon_name].dims[0])
+        else:
+            dims = ds_region[lon_name].dims
+        inside = xr.DataArray(inside, dims=dims)
+        
+        # only mask variables on the horizontal grid
+        if isinstance(ds_region, xr.Dataset):
+            for v in ds_region.data_vars:
+                if set(dims).issubset(ds_region[v].dims):
+                    ds_region[v] = ds_region[v].where(inside)
+        else:
+            ds_region = ds_region.where(inside)
+
+    return ds_region
@@ -0,0 +1,111 @@
+import numpy as np
+import xarray as xr
+
+
+def _lagged_index(index, lags, time_name):
+    """
+    Matrix (lag, time) with index shifted by each lag, NaN where there is no data.
+    Positive lag means the field lags the index, i.e. field at t is paired with index at t-lag
+    """
+
+    nt = len(index)
+    if max(abs(lag) for lag in lags) >= nt:
+        raise ValueError('Lags must be shorter than the time series (%d)' % (nt,))
+
+    X = np.full((len(lags), nt), np.nan)
+    for i, lag in enumerate(lags):
+        if lag >= 0:
+            X[i, lag:] = index[:nt-lag]
+        else:
+            X[i, :nt+lag] = index[-lag:]
+
+    return xr.DataArray(X, dims=('lag', time_name), coords={'lag': np.asarray(lags)})
+
+
+def _t_pvalue(r, n):
+    """
+    Two-sided p-value of correlation r from n samples (Student's t-test)
+    """
+
+    from scipy import stats
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        t = r * np.sqrt((n - 2) / (1 - r**2))
+
+    return 2 * stats.t.sf(np.abs(t), n - 2)
+
+
+def regression_maps(index, data, lags=[0], time_name='time'):
+    """
+    Regression and correlation of a field onto an index for several lags,
+    e.g. SST, SLP or u10 onto NINO3.4 from compute_nino_index, or onto AMOC strength.
+
+    Instead of computing means, anomalies and products in separate passes,
+    the sums n, sum(x), sum(y), sum(x*y), sum(x*x) and sum(y*y) are found for each
+    grid point and all lags at once, using a (lag, time) matrix of the lagged index.
+    All maps are then computed from these, so the field is read once
+    when the output is computed.
+
+    Input
+    -----
+    index - Index time series (DataArray or array) with the same time steps as data
+    data - DataArray with time dimension, e.g. from read_openifs or read_nemo
+    lags (optional) - List of lags in time steps (default: [0]).
+                      Positive lags mean data lags the index, i.e. data at t vs index at t-lag
+    time_name (optional) - Name of time dimension (default: time)
+
+    Output
+    ------
+    ds - Dataset (lazy) with a lag dimension and
+         slope - Regression coefficient, data units per unit index
+         intercept - Value of data where index is 0
+         correlation - Pearson correlation
+         pvalue - Two-sided p-value of correlation (Student's t-test with n-2 degrees of freedom,
+                  not corrected for autocorrelation)
+         count - Number of time steps used
+
+    Example
+    -------
+    nino34, en, ln = compute_nino_index(sst)
+    ds_reg = regression_maps(nino34, slp_anomalies, lags=[-6, -3, 0, 3, 6]).compute()
+    """
+
+    x = np.asarray(index, dtype=np.float64)
+    if len(x) != data.sizes[time_name]:
+        raise ValueError('index has %d time steps, but data has %d' % (len(x), data.sizes[time_name]))
+
+    # Shift index by its mean and data by the first time step,
+    # so that sums of squares are accurate also when the means are large
+    xref = np.nanmean(x)
+    X = _lagged_index(x - xref, lags, time_name)
+    Xvalid = X.notnull().astype(np.float64)
+    X = X.fillna(0)
+
+    yref = data.isel({time_name: 0}, drop=True).fillna(0)
+    valid = data.notnull().astype(np.float64)
+    y = (data - yref).fillna(0)
+
+    # Sums for all lags. These are computed together, so data is only read once
+    n = xr.dot(valid, Xvalid, dim=time_name)
+    sx = xr.dot(valid, X, dim=time_name)
+    sxx = xr.dot(valid, X**2, dim=time_name)
+    sy = xr.dot(y, Xvalid, dim=time_name)
+    syy = xr.dot(y**2, Xvalid, dim=time_name)
+    sxy = xr.dot(y, X, dim=time_name)
+
+    # (co)variances times n
+    cov = sxy - sx * sy / n
+    varx = sxx - sx**2 / n
+    vary = syy - sy**2 / n
+
+    slope = cov / varx
+    correlation = cov / np.sqrt(varx * vary)
+    intercept = sy / n + yref - slope * (sx / n + xref)
+
+    pvalue = xr.apply_ufunc(_t_pvalue, correlation, n, dask='parallelized', output_dtypes=[np.float64])
+
+    ds = xr.Dataset({'slope': slope, 'intercept': intercept, 'correlation': correlation,
+                     'pvalue': pvalue, 'count': n})
+    ds = ds.drop_vars([c for c in ds.coords if time_name in ds[c].dims], errors='ignore')
+
+    return ds
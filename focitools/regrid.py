@@ -0,0 +1,307 @@
+import os
+import hashlib
+import numpy as np
+import xarray as xr
+from focitools import graph_checks
+
+# Weights that have already been read or computed in this session
+_weights_cache = {}
+
+# Default directory where weight files are stored
+_default_weights_dir = os.path.join(os.path.expanduser('~'), '.cache', 'focitools', 'regrid')
+
+
+def _wrap_lon(lon):
+    """
+    Wrap longitudes to [-180, 180)
+    """
+    return (np.asarray(lon) + 180.0) % 360.0 - 180.0
+
+
+def _weights_key(ds_mesh, lon, lat, method, nsub):
+    """
+    Hash of source mesh coordinates, target grid and method.
+    Used to name the weight file so that weights are only computed once
+    for each (source mesh, target grid) pair.
+    """
+
+    h = hashlib.sha1()
+    h.update(method.encode())
+    h.update(str(nsub).encode())
+    for name in ['glamt', 'gphit', 'glamf', 'gphif']:
+        h.update(np.ascontiguousarray(ds_mesh[name].values, dtype=np.float64).tobytes())
+    h.update(np.ascontiguousarray(lon, dtype=np.float64).tobytes())
+    h.update(np.ascontiguousarray(lat, dtype=np.float64).tobytes())
+
+    return h.hexdigest()[:16]
+
+
+def _cell_edges(x):
+    """
+    Edges of cells on a regular 1D grid, taken half-way between cell centres
+    """
+
+    x = np.asarray(x, dtype=np.float64)
+    mid = 0.5 * (x[1:] + x[:-1])
+    return np.concatenate([[x[0] - (mid[0] - x[0])], mid, [x[-1] + (x[-1] - mid[-1])]])
+
+
+def _bilinear_weights(glamt, gphit, lon, lat):
+    """
+    Linear interpolation weights from NEMO T points to a regular lon/lat grid.
+
+    The source points are triangulated (Delaunay) in lon/lat space
+    and each target point gets the barycentric weights of the three corners
+    of the triangle it falls in. On a quadrilateral grid, this is the
+    piecewise-linear equivalent of bilinear interpolation.
+    """
+
+    from scipy.spatial import Delaunay
+    import scipy.sparse as sparse
+
+    ny, nx = glamt.shape
+    src_lon = _wrap_lon(glamt).ravel()
+    src_lat = np.asarray(gphit, dtype=np.float64).ravel()
+    src_idx = np.arange(ny * nx)
+
+    # Add copies of points near the dateline, shifted by 360 degrees,
+    # so that target points near -180 or 180 fall inside a triangle
+    pad = 10.0
+    east = src_lon > 180.0 - pad
+    west = src_lon < -180.0 + pad
+    pts_lon = np.concatenate([src_lon, src_lon[east] - 360.0, src_lon[west] + 360.0])
+    pts_lat = np.concatenate([src_lat, src_lat[east], src_lat[west]])
+    pts_idx = np.concatenate([src_idx, src_idx[east], src_idx[west]])
+
+    tri = Delaunay(np.column_stack([pts_lon, pts_lat]))
+
+    # target points, lat-major so that output reshapes to (lat, lon)
+    lon2, lat2 = np.meshgrid(_wrap_lon(lon), np.asarray(lat, dtype=np.float64))
+    tgt = np.column_stack([lon2.ravel(), lat2.ravel()])
+
+    # Find triangle for each target point, and barycentric coordinates
+    simplex = tri.find_simplex(tgt)
+    inside = simplex >= 0
+    transform = tri.transform[simplex[inside]]
+    delta = tgt[inside] - transform[:, 2]
+    bary = np.einsum('ijk,ik->ij', transform[:, :2], delta)
+    wgt = np.column_stack([bary, 1.0 - bary.sum(axis=1)])
+
+    rows = np.repeat(np.where(inside)[0], 3)
+    cols = pts_idx[tri.simplices[simplex[inside]]].ravel()
+
+    W = sparse.csr_matrix((wgt.ravel(), (rows, cols)), shape=(tgt.shape[0], ny * nx))
+    W.sum_duplicates()
+    W.eliminate_zeros()
+
+    return W
+
+
+def _conservative_weights(glamt, gphit, glamf, gphif, areacello, lon, lat, nsub=4):
+    """
+    Area-conserving weights from NEMO T cells to a regular lon/lat grid.
+
+    Each T cell is split into nsub x nsub sub-cells by bilinear interpolation
+    between its four corners (F points). Each sub-cell carries 1/nsub^2 of
+    the cell area and is assigned to the target cell containing its centre.
+    This is a first-order conservative remapping where the accuracy
+    is set by nsub.
+    """
+
+    import scipy.sparse as sparse
+
+    ny, nx = glamt.shape
+    nlat, nlon = len(lat), len(lon)
+
+    # Corners of T cell (j,i) are F points (j-1,i-1), (j-1,i), (j,i), (j,i-1).
+    # First row and column have no corners and are skipped
+    # (on ORCA grids, the first column is a copy of the second last column).
+    jj, ii = np.meshgrid(np.arange(1, ny), np.arange(1, nx), indexing='ij')
+
+    # Unwrap corner longitudes relative to the cell centre
+    lamt = np.asarray(glamt, dtype=np.float64)[1:, 1:]
+    lamf = np.asarray(glamf, dtype=np.float64)
+    phif = np.asarray(gphif, dtype=np.float64)
+    corners_lon = [lamf[:-1, :-1], lamf[:-1, 1:], lamf[1:, 1:], lamf[1:, :-1]]
+    corners_lon = [lamt + _wrap_lon(c - lamt) for c in corners_lon]
+    corners_lat = [phif[:-1, :-1], phif[:-1, 1:], phif[1:, 1:], phif[1:, :-1]]
+
+    area = np.asarray(areacello, dtype=np.float64)[1:, 1:]
+    src = (jj * nx + ii).ravel()
+
+    lon_edges = _cell_edges(lon)
+    lat_edges = _cell_edges(lat)
+
+    rows, cols, vals = [], [], []
+    frac = (np.arange(nsub) + 0.5) / nsub
+    for v in frac:
+        for u in frac:
+
+            # bilinear interpolation between corners
+            w = [(1-u)*(1-v), u*(1-v), u*v, (1-u)*v]
+            plon = sum(wk * ck for wk, ck in zip(w, corners_lon)).ravel()
+            plat = sum(wk * ck for wk, ck in zip(w, corners_lat)).ravel()
+
+            # find target cell. Longitudes are periodic
+            plon = lon_edges[0] + (plon - lon_edges[0]) % 360.0
+            ilon = np.searchsorted(lon_edges, plon) - 1
+            ilat = np.searchsorted(lat_edges, plat) - 1
+            ok = (ilon >= 0) & (ilon < nlon) & (ilat >= 0) & (ilat < nlat)
+
+            rows.append(ilat[ok] * nlon + ilon[ok])
+            cols.append(src[ok])
+            vals.append(area.ravel()[ok] / nsub**2)
+
+    W = sparse.csr_matrix((np.concatenate(vals), (np.concatenate(rows), np.concatenate(cols))),
+                          shape=(nlat * nlon, ny * nx))
+    W.sum_duplicates()
+
+    return W
+
+
+def regrid_weights_nemo(ds_mesh, lon, lat, method='bilinear', weights_dir=None, nsub=4):
+    """
+    Get sparse weights for regridding from the NEMO (ORCA) grid to a regular lon/lat grid.
+
+    Weights are computed once for each (source mesh, target grid, method) and stored
+    as a compressed sparse matrix in weights_dir. Later calls, also in new sessions,
+    read the weights from file instead of recomputing them.
+
+    Input
+    -----
+    ds_mesh - Dataset from read_nemo_mesh
+    lon - 1D array with target longitudes
+    lat - 1D array with target latitudes
+    method (optional) - 'bilinear' (default) or 'conservative'
+    weights_dir (optional) - Where to store weight files. Default: ~/.cache/focitools/regrid
+    nsub (optional) - Sub-cells per direction for conservative weights (default: 4)
+
+    Output
+    ------
+    W - scipy.sparse.csr_matrix with shape (nlat*nlon, ny*nx)
+
+    Note
+    ----
+    'bilinear' uses barycentric weights on a triangulation of the T points.
+    'conservative' approximates the overlap of T cells and target cells by
+    splitting each T cell into nsub x nsub sub-cells.
+    """
+
+    import scipy.sparse as sparse
+
+    if method not in ['bilinear', 'conservative']:
+        raise ValueError("method must be 'bilinear' or 'conservative', not %s" % (method,))
+
+    if weights_dir is None:
+        weights_dir = _default_weights_dir
+
+    key = _weights_key(ds_mesh, lon, lat, method, nsub)
+    weights_file = os.path.join(weights_dir, 'regrid_%s_%s.npz' % (method, key))
+
+    # already used in this session
+    if weights_file in _weights_cache:
+        return _weights_cache[weights_file]
+
+    # computed before, read from file
+    if os.path.exists(weights_file):
+        W = sparse.load_npz(weights_file).tocsr()
+
+    else:
+        print(' Compute %s regridding weights ' % (method,))
+        if method == 'bilinear':
+            W = _bilinear_weights(ds_mesh['glamt'].values, ds_mesh['gphit'].values, lon, lat)
+        else:
+            W = _conservative_weights(ds_mesh['glamt'].values, ds_mesh['gphit'].values,
+                                      ds_mesh['glamf'].values, ds_mesh['gphif'].values,
+                                      ds_mesh['areacello'].values, lon, lat, nsub=nsub)
+
+        print(' Save weights to : ')
+        print(weights_file)
+        os.makedirs(weights_dir, exist_ok=True)
+        sparse.save_npz(weights_file, W, compressed=True)
+
+    _weights_cache[weights_file] = W
+
+    return W
+
+
+def _apply_weights(arr, W, nlat, nlon):
+    """
+    Apply sparse weights W to the last two (y, x) axes of a numpy array
+    """
+
+    # flatten horizontal dims, and all other dims
+    shape = arr.shape[:-2]
+    flat = arr.reshape(-1, arr.shape[-2] * arr.shape[-1]).T
+
+    # Weights are normalised by the valid (ocean) part of each target cell
+    valid = np.isfinite(flat)
+    num = W @ np.where(valid, flat, 0)
+    den = W @ valid.astype(flat.dtype)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        out = np.where(den > 0, num / den, np.nan)
+
+    return out.T.reshape(shape + (nlat, nlon)).astype(arr.dtype)
+
+
+def regrid_nemo(data, ds_mesh, lon, lat, method='bilinear', mask=None,
+                weights_dir=None, x_name='x', y_name='y'):
+    """
+    Regrid NEMO data to a regular lon/lat grid.
+
+    Weights come from regrid_weights_nemo, so they are only computed once.
+    Applying them is a sparse matrix product for each dask chunk,
+    with the weights stored once in the graph and shared by all chunks.
+    x and y are put in one chunk, but any other dimension (time, depth) can be chunked.
+
+    Input
+    -----
+    data - DataArray with x and y dimensions, e.g. from read_nemo
+    ds_mesh - Dataset from read_nemo_mesh
+    lon - 1D array with target longitudes
+    lat - 1D array with target latitudes
+    method (optional) - 'bilinear' (default) or 'conservative'
+    mask (optional) - land-sea mask, 1 for ocean. Default: use NaNs in data
+    weights_dir (optional) - Where to store weight files
+    x_name (optional) - name of x dimension (default: x)
+    y_name (optional) - name of y dimension (default: y)
+
+    Output
+    ------
+    data_out - DataArray on lat, lon grid. Target cells without ocean are NaN.
+    """
+
+    import dask
+    import dask.array as da
+
+    W = regrid_weights_nemo(ds_mesh, lon, lat, method=method, weights_dir=weights_dir)
+    nlat, nlon = len(lat), len(lon)
+
+    if mask is not None:
+        data = data.where(mask == 1)
+
+    data = graph_checks.maybe_preflight(data)
+
+    # W is put in the graph once, and shared by the tasks of all chunks
+    Wd = dask.delayed(W)
+
+    def _regrid(arr):
+        if not isinstance(arr, da.Array):
+            return _apply_weights(arr, W, nlat, nlon)
+        arr = arr.rechunk({arr.ndim - 2: -1, arr.ndim - 1: -1})
+        return da.map_blocks(_apply_weights, arr, Wd, nlat, nlon, dtype=arr.dtype,
+                             chunks=arr.chunks[:-2] + ((nlat,), (nlon,)))
+
+    data_out = xr.apply_ufunc(_regrid, data,
+                              input_core_dims=[[y_name, x_name]],
+                              output_core_dims=[['lat', 'lon']],
+                              exclude_dims=set((y_name, x_name)),
+                              dask='allowed')
+
+    # drop 2D coordinates on the NEMO grid, and add new lon lat
+    data_out = data_out.drop_vars([c for c in data_out.coords if c not in data_out.dims], errors='ignore')
+    data_out = data_out.assign_coords(lat=('lat', np.asarray(lat)), lon=('lon', np.asarray(lon)))
+    data_out.name = data.name
+    data_out = data_out.assign_attrs(data.attrs)
+
+    return data_out
@@ -0,0 +1,155 @@
+import numpy as np
+import xarray as xr
+from focitools import regions
+
+# KD-trees that have already been built, for each grid and mask
+_tree_cache = {}
+
+# Earth radius in km
+_earth_radius = 6371.0
+
+
+def _lonlat_to_xyz(lon, lat):
+    """
+    Convert lon, lat in degrees to coordinates on the unit sphere
+    """
+
+    lon = np.deg2rad(np.asarray(lon, dtype=np.float64))
+    lat = np.deg2rad(np.asarray(lat, dtype=np.float64))
+
+    return np.column_stack([np.cos(lat) * np.cos(lon),
+                            np.cos(lat) * np.sin(lon),
+                            np.sin(lat)])
+
+
+def mesh_tree(lon, lat, mask=None):
+    """
+    Build a KD-tree of grid points on the unit sphere.
+
+    Using 3D coordinates on the sphere means distances are correct
+    near the poles and across the dateline, also on the tripolar ORCA grid.
+    The tree is built once per grid (and mask) and cached.
+
+    Input
+    -----
+    lon - 2D (e.g. nav_lon) or 1D longitudes
+    lat - 2D (e.g. nav_lat) or 1D latitudes
+    mask (optional) - Only use points where mask is 1, e.g. tmask at surface
+
+    Output
+    ------
+    tree - scipy.spatial.cKDTree
+    points - Flat (ravelled) index of each point in the tree
+    shape - Shape of the 2D grid
+    """
+
+    from scipy.spatial import cKDTree
+
+    lon = np.asarray(lon, dtype=np.float64)
+    lat = np.asarray(lat, dtype=np.float64)
+    if lon.ndim == 1:
+        lon, lat = np.meshgrid(lon, lat)
+
+    mask = np.ones(lon.shape, dtype=bool) if mask is None else (np.asarray(mask) == 1)
+    key = (regions._grid_key(lon, lat), regions._grid_key(mask, mask))
+
+    if key not in _tree_cache:
+        points = np.where(mask.ravel())[0]
+        tree = cKDTree(_lonlat_to_xyz(lon.ravel()[points], lat.ravel()[points]))
+        _tree_cache[key] = (tree, points, lon.shape)
+
+    return _tree_cache[key]
+
+
+def nearest_points(lon, lat, station_lon, station_lat, mask=None):
+    """
+    Find the nearest grid point for a batch of positions.
+
+    Input
+    -----
+    lon - 2D (e.g. nav_lon) or 1D longitudes of grid
+    lat - 2D (e.g. nav_lat) or 1D latitudes of grid
+    station_lon - List or array of longitudes of stations
+    station_lat - List or array of latitudes of stations
+    mask (optional) - Only use points where mask is 1, e.g. tmask at surface
+
+    Output
+    ------
+    jj - j (y) index of nearest point for each station
+    ii - i (x) index of nearest point for each station
+    dist - Distance (km) to nearest point
+    """
+
+    tree, points, shape = mesh_tree(lon, lat, mask=mask)
+
+    # chord length on unit sphere
+    chord, k = tree.query(_lonlat_to_xyz(station_lon, station_lat))
+
+    jj, ii = np.unravel_index(points[k], shape)
+    dist = 2 * _earth_radius * np.arcsin(np.clip(chord / 2, 0, 1))
+
+    return jj, ii, dist
+
+
+def extract_stations(ds_all, station_lon, station_lat, names=None, mask=None,
+                     lon_name='nav_lon', lat_name='nav_lat'):
+    """
+    Extract time series at many stations (moorings, Argo floats, etc)
+    from one or more experiments.
+
+    Nearest grid points are found once with a KD-tree (see mesh_tree),
+    and all stations are then taken with one vectorized isel,
+    so dask gathers all points from each chunk in one go.
+
+    Input
+    -----
+    ds_all - Dataset or list of Datasets, e.g. from read_nemo or read_openifs
+    station_lon - List or array of longitudes of stations
+    station_lat - List or array of latitudes of stations
+    names (optional) - Names of stations. Default: 0, 1, 2, ...
+    mask (optional) - Only use ocean points, e.g. tmask at surface
+    lon_name (optional) - Name of longitude (default: nav_lon). Use lon for OpenIFS
+    lat_name (optional) - Name of latitude (default: nav_lat). Use lat for OpenIFS
+
+    Output
+    ------
+    ds_stations - Dataset (or list of Datasets) with a station dimension
+    """
+
+    single = isinstance(ds_all, (xr.Dataset, xr.DataArray))
+    if single:
+        ds_all = [ds_all]
+
+    station_lon = np.atleast_1d(np.asarray(station_lon, dtype=np.float64))
+    station_lat = np.atleast_1d(np.asarray(station_lat, dtype=np.float64))
+    if names is None:
+        names = np.arange(len(station_lon))
+
+    ds_stations = []
+    for ds in ds_all:
+
+        lon, lat = ds[lon_name], ds[lat_name]
+        jj, ii, dist = nearest_points(lon, lat, station_lon, station_lat, mask=mask)
+
+        # dimension names of grid
+        if lon.ndim == 1:
+            y_name, x_name = lat.dims[0], lon.dims[0]
+        else:
+            y_name, x_name = lon.dims
+
+        # take all stations at once
+        _ds = ds.isel({y_name: xr.DataArray(jj, dims='station'),
+                       x_name: xr.DataArray(ii, dims='station')})
+
+        _ds = _ds.assign_coords(station=('station', np.asarray(names)),
+                                station_lon=('station', station_lon),
+                                station_lat=('station', station_lat),
+                                station_dist=('station', dist))
+        _ds['station_dist'].attrs['units'] = 'km'
+
+        ds_stations.append(_ds)
+
+    if single:
+        return ds_stations[0]
+
+    return ds_stations
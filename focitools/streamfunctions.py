@@ -1,5 +1,7 @@
 import numpy as np
 import xarray as xr
+from focitools import eos
+from focitools import graph_checks
 
 def compute_amoc_strength(da_amoc, amoc_lat=26.5):
     """
@@ -29,4 +31,108 @@ def compute_amoc_strength(da_amoc, amoc_lat=26.5):
     amoc = da_amoc.sel(x=0,y=amoc_j26).max('depthw').drop('lat')
 
     return amoc
-    
\ No newline at end of file
+
+
+def compute_moc_sigma(ds_t, ds_v, ds_mesh, sigma_bins=None, basin_mask=None, 
+                      temp_name='votemper', salt_name='vosaline', v_name='vomecrty', 
+                      sigma=eos.sigma2):
+    """
+    Compute meridional overturning in density space, e.g. sigma2 coordinates. 
+    
+    Density is computed from temperature and salinity for each time chunk, 
+    interpolated to V points, and meridional transports are binned into 
+    density classes with a vectorised bincount for each latitude row. 
+    The stream function is the cumulative sum over density classes. 
+    Everything is done chunk by chunk in time, and each chunk is binned one time step 
+    at a time, so memory is set by the chunk size and a few 3D fields. 
+    Depth, y and x must not be split between chunks (they are rechunked if they are). 
+    
+    Input
+    -----
+    ds_t - Dataset with temperature and salinity (grid_T), e.g. from read_nemo
+    ds_v - Dataset with meridional velocity (grid_V), e.g. from read_nemo with grid='grid_V'
+    ds_mesh - Dataset from read_nemo_mesh
+    sigma_bins (optional) - Edges of density classes. 
+                            Default: 30 to 38 kg/m3 in steps of 0.05 (suitable for sigma2)
+    basin_mask (optional) - 2D mask (y, x) on V points, e.g. Atlantic from maskglo. Default: global
+    temp_name, salt_name, v_name (optional) - Names of variables
+    sigma (optional) - Function to compute density from (t, s). Default: eos.sigma2
+    
+    Output
+    ------
+    moc - Overturning stream function (time, y, sigma) in Sv, 
+          i.e. northward transport lighter than sigma at each latitude row
+    """
+    
+    if sigma_bins is None:
+        sigma_bins = np.arange(30.0, 38.0001, 0.05)
+    sigma_bins = np.asarray(sigma_bins, dtype=np.float64)
+    nbins = len(sigma_bins) + 1
+    
+    # transport per unit velocity at V points (depth, y, x)
+    dx = ds_mesh['e1v'] * ds_mesh['vmask']
+    if basin_mask is not None:
+        dx = dx * basin_mask
+    area_v = (dx * ds_mesh['dzv']).fillna(0).rename({'depthv':'z'}).transpose('z','y','x')
+    
+    # Use same name for depth dimension on T and V points
+    temp = ds_t[temp_name].rename({'deptht':'z'})
+    salt = ds_t[salt_name].rename({'deptht':'z'})
+    vel = ds_v[v_name].rename({'depthv':'z'}).drop_vars(['nav_lon','nav_lat','time'], errors='ignore')
+    
+    # checked together, so all inputs keep the same time chunks
+    ds_in = graph_checks.maybe_preflight(xr.Dataset({'t':temp, 's':salt, 'v':vel}))
+    temp, salt, vel = ds_in['t'], ds_in['s'], ds_in['v']
+    
+    def _bin_transport(t, s, v, area):
+        
+        # t, s, v are (time, z, y, x) for one time chunk
+        # Bin one time step at a time, so temporaries are only (z, y, x)
+        shape = t.shape[:-3]
+        nz, ny, nx = t.shape[-3:]
+        t = t.reshape((-1, nz, ny, nx))
+        s = s.reshape((-1, nz, ny, nx))
+        v = v.reshape((-1, nz, ny, nx))
+        
+        # flat index of (y, class)
+        jj = np.arange(ny)[None, :, None] * nbins
+        
+        out = np.empty((t.shape[0], ny, nbins))
+        for n in range(t.shape[0]):
+            
+            rho = sigma(t[n].astype(np.float64), s[n].astype(np.float64))
+            
+            # density at V points, average of T points to the south and north
+            rho_v = np.full(rho.shape, np.nan)
+            rho_v[:, :-1, :] = 0.5 * (rho[:, :-1, :] + rho[:, 1:, :])
+            
+            # transport (m3/s)
+            trp = np.nan_to_num(v[n] * area)
+            
+            # density class for each point, and sum over depth and x
+            k = np.searchsorted(sigma_bins, np.nan_to_num(rho_v, nan=-1e9))
+            binned = np.bincount((jj + k).ravel(), weights=trp.ravel(), minlength=ny*nbins)
+            
+            # stream function, cumulative sum from light to dense
+            out[n] = np.cumsum(binned.reshape(ny, nbins), axis=-1) * 1e-6
+        
+        return out.reshape(shape + (ny, nbins))
+    
+    # z, y and x are core dimensions, so each block needs whole columns and rows. 
+    # read_nemo does not chunk these, otherwise they are rechunked here. 
+    moc = xr.apply_ufunc(_bin_transport, temp, salt, vel, area_v, 
+                         input_core_dims=[['z','y','x']]*4, 
+                         output_core_dims=[['y','sigma']], 
+                         exclude_dims=set(('z','x')), 
+                         dask='parallelized', 
+                         output_dtypes=[np.float64], 
+                         dask_gufunc_kwargs={'output_sizes':{'sigma':nbins}, 
+                                             'allow_rechunk':True})
+    
+    # density class edges. Last class is everything denser than the last edge
+    moc = moc.assign_coords(sigma=('sigma', np.append(sigma_bins, np.inf)))
+    moc = moc.drop_vars(['nav_lon'], errors='ignore')
+    moc.name = 'moc_sigma'
+    moc = moc.assign_attrs(units='Sv')
+    
+    return moc
@@ -0,0 +1,125 @@
+import collections
+from concurrent.futures import ThreadPoolExecutor
+import xarray as xr
+
+
+def _load_block(ds, time_name, start, stop):
+    """
+    Read one block of time steps into memory
+    """
+    return ds.isel({time_name: slice(start, stop)}).load()
+
+
+def iter_time_blocks(ds, block_size=None, prefetch=2, max_bytes=None, time_name='time'):
+    """
+    Iterate over a Dataset (or DataArray) one block of time steps at a time,
+    while the next blocks are read in the background.
+
+    While the caller works on one block, up to `prefetch` blocks are read
+    by a thread pool, so computing and reading (e.g. from Lustre) overlap.
+
+    Input
+    -----
+    ds - xarray.Dataset or DataArray, e.g. from read_nemo or read_openifs
+    block_size (optional) - Number of time steps per block.
+                            Default: size of first dask chunk along time
+    prefetch (optional) - Number of blocks to read ahead (default: 2)
+    max_bytes (optional) - Max bytes of blocks held in memory at once, i.e. the block
+                           being used, the blocks read ahead, and the previous block,
+                           which the caller holds until the next one is returned.
+                           Reduces prefetch if needed (default: no limit)
+    time_name (optional) - Name of time dimension (default: time)
+
+    Output
+    ------
+    Generator yielding blocks as xarray objects held in memory
+
+    Example
+    -------
+    for block in iter_time_blocks(ds['sosstsst'], prefetch=4):
+        ...
+    """
+
+    ntime = ds.sizes[time_name]
+
+    if block_size is None:
+        chunks = ds.chunksizes
+        if time_name in chunks:
+            block_size = chunks[time_name][0]
+        else:
+            block_size = 1
+
+    # Limit number of blocks in memory
+    if max_bytes is not None:
+        block_bytes = ds.isel({time_name: slice(0, block_size)}).nbytes
+        nblocks = int(max_bytes // max(block_bytes, 1))
+        if nblocks < 2:
+            raise MemoryError('Two blocks of %d time steps need %.1f MB, but max_bytes is %.1f MB' %
+                              (block_size, 2 * block_bytes / 1e6, max_bytes / 1e6))
+        prefetch = min(prefetch, nblocks - 2)
+
+    starts = list(range(0, ntime, block_size))
+
+    # Read blocks in main thread if no prefetching
+    if prefetch == 0:
+        for start in starts:
+            yield _load_block(ds, time_name, start, start + block_size)
+        return
+
+    pool = ThreadPoolExecutor(max_workers=prefetch)
+    queue = collections.deque()
+    try:
+        for start in starts:
+            queue.append(pool.submit(_load_block, ds, time_name, start, start + block_size))
+
+            # wait for oldest block once enough blocks are being read
+            if len(queue) > prefetch:
+                yield queue.popleft().result()
+
+        while queue:
+            yield queue.popleft().result()
+
+    finally:
+        # if the caller stops early, dont read more blocks
+        for future in queue:
+            future.cancel()
+        pool.shutdown(wait=True)
+
+
+def stream_apply(func, ds, *args, block_size=None, prefetch=2, max_bytes=None,
+                 time_name='time', **kwargs):
+    """
+    Apply a diagnostic to a Dataset one time block at a time,
+    reading the next blocks in the background (see iter_time_blocks),
+    and concatenate the results along time.
+
+    Any function that works on each time step separately can be used,
+    e.g. area_mean_nemo, seaice_areas, ice_volumes, area_mean.
+
+    Input
+    -----
+    func - Function to apply. Called as func(block, *args, **kwargs)
+    ds - xarray.Dataset or DataArray
+    *args - Other arguments to func, e.g. mask and cell area
+    block_size, prefetch, max_bytes, time_name (optional) - see iter_time_blocks
+    **kwargs - Other keyword arguments to func
+
+    Output
+    ------
+    result - Output of func for all blocks concatenated along time
+
+    Example
+    -------
+    sst_mean = stream_apply(area_mean_nemo, ds['sosstsst'],
+                            ds_mesh['tmask'].isel(deptht=0), ds_mesh['areacello'],
+                            prefetch=4)
+    """
+
+    results = []
+    for block in iter_time_blocks(ds, block_size=block_size, prefetch=prefetch,
+                                  max_bytes=max_bytes, time_name=time_name):
+        results.append(func(block, *args, **kwargs).load())
+
+    result = xr.concat(results, dim=time_name)
+
+    return result
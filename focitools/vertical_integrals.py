@@ -0,0 +1,136 @@
+import numpy as np
+import xarray as xr
+
+# Gravity (m/s2), as in IFS
+_g = 9.80665
+
+
+def _plev_integral(data, ps, levels, ptop, mean):
+    """
+    Mass-weighted integral over pressure levels (last axis of data).
+    Layer k goes from half way to the level above to half way to the level below,
+    or to the surface for the lowest level above ground. Levels below ground are skipped.
+    The product and sum are done one level at a time, so no 4D temporaries are made.
+    """
+
+    # surface first
+    order = np.argsort(levels)[::-1]
+    p = levels[order]
+    mid = 0.5 * (p[1:] + p[:-1])
+    top = np.concatenate([mid, [ptop]])
+
+    shape = np.broadcast(data[..., 0], ps).shape
+    total = np.zeros(shape)
+    mass = np.zeros(shape)
+    for k, kk in enumerate(order):
+        above_ground = p[k] <= ps
+        if k == 0:
+            bottom = ps
+        else:
+            # lowest level above ground goes down to the surface
+            bottom = np.where(p[k-1] > ps, ps, mid[k-1])
+        dp = np.where(above_ground, bottom - top[k], 0.0)
+
+        x = data[..., kk]
+        total += np.where(above_ground & np.isfinite(x), x * dp, 0.0)
+        mass += np.where(above_ground & np.isfinite(x), dp, 0.0)
+
+    if mean:
+        return total / mass
+
+    return total / _g
+
+
+def _mlev_integral(data, ps, a_half, b_half, mean):
+    """
+    Mass-weighted integral over hybrid model levels (last axis of data),
+    with dp = da + db * ps for each level
+    """
+
+    da = np.diff(a_half)
+    db = np.diff(b_half)
+
+    shape = np.broadcast(data[..., 0], ps).shape
+    total = np.zeros(shape)
+    mass = np.zeros(shape)
+    for k in range(data.shape[-1]):
+        dp = np.abs(da[k] + db[k] * ps)
+        x = data[..., k]
+        total += np.where(np.isfinite(x), x * dp, 0.0)
+        mass += np.where(np.isfinite(x), dp, 0.0)
+
+    if mean:
+        return total / mass
+
+    return total / _g
+
+
+def vertical_integral_plev(data, ps, lev_name='pressure_levels', ptop=0.0, mean=False):
+    """
+    Mass-weighted vertical integral on pressure levels, e.g. column water vapour from
+    specific humidity, or energy transports, from read_openifs with a pl grid.
+
+    integral = 1/g * sum(data * dp) over levels above the surface.
+    Layer thickness dp goes half way to the neighbouring levels, and the lowest level
+    above ground goes down to the surface pressure (Trenberth 1991).
+    The thickness and product are made for each chunk with apply_ufunc,
+    so this can be combined with area_mean and computed in one pass, e.g.
+    area_mean(vertical_integral_plev(ds['q'], ds['sp']))
+
+    Input
+    -----
+    data - DataArray with pressure levels, e.g. (time, pressure_levels, lat, lon)
+    ps - Surface pressure (Pa), e.g. (time, lat, lon)
+    lev_name (optional) - Name of level dimension, in Pa (default: pressure_levels)
+    ptop (optional) - Pressure at top of the top layer (default: 0)
+    mean (optional) - Return mass-weighted mean instead of integral (default: False)
+
+    Output
+    ------
+    integral - DataArray, data units times kg/m2 (e.g. kg/m2 for specific humidity in kg/kg)
+    """
+
+    levels = np.asarray(data[lev_name].values, dtype=np.float64)
+
+    integral = xr.apply_ufunc(_plev_integral, data, ps,
+                              input_core_dims=[[lev_name], []],
+                              kwargs={'levels': levels, 'ptop': ptop, 'mean': mean},
+                              dask='parallelized', output_dtypes=[np.float64])
+
+    return integral
+
+
+def vertical_integral_mlev(data, ps, a_half, b_half, lev_name='lev', mean=False):
+    """
+    Mass-weighted vertical integral on hybrid model levels, e.g. from ECHAM or OpenIFS model level output.
+
+    Layer thickness is dp = (a[k+1] - a[k]) + (b[k+1] - b[k]) * ps,
+    computed for each chunk with apply_ufunc and combined with the product,
+    so this can be combined with area_mean and computed in one pass.
+
+    Input
+    -----
+    data - DataArray with model levels, e.g. (time, lev, lat, lon)
+    ps - Surface pressure (Pa), e.g. (time, lat, lon). Use exp(lnsp) for log surface pressure
+    a_half - Hybrid coefficients a (Pa) at the nlev+1 half levels, e.g. hyai
+    b_half - Hybrid coefficients b at the nlev+1 half levels, e.g. hybi
+    lev_name (optional) - Name of level dimension (default: lev)
+    mean (optional) - Return mass-weighted mean instead of integral (default: False)
+
+    Output
+    ------
+    integral - DataArray, data units times kg/m2
+    """
+
+    a_half = np.asarray(a_half, dtype=np.float64)
+    b_half = np.asarray(b_half, dtype=np.float64)
+    if len(a_half) != data.sizes[lev_name] + 1:
+        raise ValueError('a_half and b_half need %d half levels, got %d' %
+                         (data.sizes[lev_name] + 1, len(a_half)))
+
+    integral = xr.apply_ufunc(_mlev_integral, data, ps,
+                              input_core_dims=[[lev_name], []],
+                              kwargs={'a_half': a_half, 'b_half': b_half, 'mean': mean},
+                              dask='parallelized', output_dtypes=[np.float64])
+
+    return integral
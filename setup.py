@@ -14,6 +14,8 @@ requirements = [
     "numpy",
     "cftime",
     "xarray",
+    "dask",
+    "scipy",
 ]
 
 setup_requirements = []
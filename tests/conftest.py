@@ -0,0 +1,42 @@
+import datetime
+import cftime
+import numpy as np
+import pytest
+import xarray as xr
+
+
+def write_nemo_files(esm_dir, exp='EXP1', years=(2000, 2001), months=range(1, 13),
+                     freq='1m', ny=6, nx=8, prefix='', subdir=''):
+    """
+    Write small NEMO-like grid_T files, one file per year,
+    with a standard calendar and a time_centered variable
+    """
+
+    outdir = esm_dir / exp / 'outdata' / 'nemo' / subdir
+    outdir.mkdir(parents=True, exist_ok=True)
+
+    lon, lat = np.meshgrid(np.linspace(-180, 170, nx), np.linspace(-60, 60, ny))
+    rng = np.random.default_rng(0)
+
+    for year in years:
+        if freq == '1y':
+            times = [cftime.DatetimeGregorian(year, 7, 1)]
+        elif freq == '5d':
+            times = [cftime.DatetimeGregorian(year, 1, 3) + datetime.timedelta(days=5*i) for i in range(73)]
+        else:
+            times = [cftime.DatetimeGregorian(year, m, 15) for m in months]
+        nt = len(times)
+        ds = xr.Dataset({'sosstsst': (('time_counter', 'y', 'x'), rng.random((nt, ny, nx)).astype(np.float32)),
+                         'time_centered': ('time_counter', times)},
+                        coords={'time_counter': times,
+                                'nav_lon': (('y', 'x'), lon.astype(np.float32)),
+                                'nav_lat': (('y', 'x'), lat.astype(np.float32))})
+        fname = outdir / ('%s%s_%s_%d0101_%d1231_grid_T.nc' % (prefix, exp, freq, year, year))
+        ds.to_netcdf(fname)
+
+    return esm_dir
+
+
+@pytest.fixture
+def esm_dir(tmp_path):
+    return write_nemo_files(tmp_path / 'esm')
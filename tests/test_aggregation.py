@@ -0,0 +1,52 @@
+import cftime
+import numpy as np
+import pytest
+import xarray as xr
+import focitools
+from focitools.read_nemo import plan_aggregation
+from conftest import write_nemo_files
+
+
+def test_plan_uses_complete_yearly_files(tmp_path):
+    esm_dir = write_nemo_files(tmp_path / 'esm', freq='1m')
+    write_nemo_files(esm_dir, freq='1y', subdir='ym')
+
+    assert plan_aggregation('EXP1', slice(None), str(esm_dir), '1y', freq='1m') == '1y'
+
+
+def test_plan_skips_incomplete_monthly_files(tmp_path):
+    """
+    Monthly files with only half of each year can not replace 5-day data
+    """
+
+    esm_dir = write_nemo_files(tmp_path / 'esm', freq='5d')
+    write_nemo_files(esm_dir, freq='1m', months=range(1, 7))
+
+    assert plan_aggregation('EXP1', slice(None), str(esm_dir), '1y', freq='5d') == '5d'
+
+
+def test_plan_skips_yearly_files_for_part_of_year(tmp_path):
+    """
+    Means of half a year of monthly data are not the yearly means
+    """
+
+    esm_dir = write_nemo_files(tmp_path / 'esm', freq='1m', months=range(1, 7))
+    write_nemo_files(esm_dir, freq='1y', subdir='ym')
+
+    assert plan_aggregation('EXP1', slice(None), str(esm_dir), '1y', freq='1m') == '1m'
+
+
+def test_plan_rejects_finer_aggregate(esm_dir):
+    with pytest.raises(ValueError):
+        plan_aggregation('EXP1', slice(None), str(esm_dir), '1m', freq='1y')
+
+
+def test_downsample_weights_by_month_length():
+    times = [cftime.DatetimeNoLeap(2001, m, 15) for m in range(1, 13)]
+    data = xr.DataArray(np.arange(12.), dims='time', coords={'time': times})
+
+    days = np.array([t.daysinmonth for t in times])
+    expected = np.sum(days * np.arange(12.)) / 365.
+
+    ds_mean = focitools.downsample(data.chunk({'time': 5}), freq='1y')
+    np.testing.assert_allclose(ds_mean.values, [expected])
@@ -0,0 +1,63 @@
+import numpy as np
+import pytest
+import xarray as xr
+from focitools.agrif import agrif_masks, agrif_integral, read_agrif_fixed_grids
+
+
+def _mesh(ny, nx, area):
+    return xr.Dataset({'areacello': (('y', 'x'), np.full((ny, nx), float(area))),
+                       'tmask': (('deptht', 'y', 'x'), np.ones((1, ny, nx), dtype=np.int8))})
+
+
+@pytest.fixture
+def fixed_grids(tmp_path):
+    """
+    One nest over parent cells 6..9 in x and 4..6 in y (Fortran), refined 3 times,
+    so its boundaries are on parent U/V points, half way between T points
+    """
+
+    filename = tmp_path / 'AGRIF_FixedGrids.in'
+    filename.write_text('1\n5 9 3 6 3 3 3\n0\n')
+    return filename
+
+
+@pytest.mark.parametrize('nbghostcells', [1, 3])
+def test_combined_area_counts_each_cell_once(fixed_grids, nbghostcells):
+    halo = nbghostcells + 1
+    parent = _mesh(10, 12, 9.0)
+    nest = _mesh(3 * 3 + 2 * halo, 4 * 3 + 2 * halo, 1.0)
+
+    masks = agrif_masks([parent, nest], fixed_grids)
+    assert masks[0].sum() == 10 * 12 - 4 * 3
+    assert masks[1].sum() == 9 * 12
+
+    ones = [xr.ones_like(m['areacello']) for m in (parent, nest)]
+    total = agrif_integral(ones, [parent, nest], fixed_grids=fixed_grids)
+    assert float(total) == 9.0 * 10 * 12
+
+    # nest values are only counted in the footprint
+    values = [ones[0], 2 * ones[1]]
+    total = agrif_integral(values, [parent, nest], masks=masks)
+    assert float(total) == 9.0 * (10 * 12 - 4 * 3) + 2 * 9.0 * 4 * 3
+
+
+def test_footprint_position(fixed_grids):
+    parent = _mesh(10, 12, 9.0)
+    nest = _mesh(3 * 3 + 4, 4 * 3 + 4, 1.0)
+
+    covered = agrif_masks([parent, nest], fixed_grids, nbghostcells=1)[0].values == 0
+    jj, ii = np.where(covered)
+    assert (ii.min(), ii.max(), jj.min(), jj.max()) == (5, 8, 3, 5)
+
+
+def test_nest_size_must_match(fixed_grids):
+    parent = _mesh(10, 12, 9.0)
+    nest = _mesh(3 * 3 + 4, 4 * 3 + 4, 1.0)
+
+    with pytest.raises(ValueError):
+        agrif_masks([parent, nest], fixed_grids, nbghostcells=3)
+
+
+def test_read_fixed_grids(fixed_grids):
+    assert read_agrif_fixed_grids(fixed_grids) == [{'imin': 5, 'imax': 9, 'jmin': 3, 'jmax': 6,
+                                                    'rx': 3, 'ry': 3}]
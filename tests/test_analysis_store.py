@@ -0,0 +1,23 @@
+import cftime
+import pytest
+import focitools
+
+
+@pytest.mark.parametrize('strategy', ['time', 'space'])
+def test_store_round_trip(esm_dir, tmp_path, strategy):
+    """
+    Static coordinates (nav_lon, nav_lat, time_centered) and time decoding
+    must be the same from the store as from the netCDF files
+    """
+
+    pytest.importorskip('zarr')
+
+    store_dir = str(tmp_path / 'stores')
+    focitools.convert_to_analysis_store('EXP1', str(esm_dir), store_dir, strategy=strategy)
+
+    ref = focitools.read_nemo(['EXP1'], [slice(None)], str(esm_dir))[0]
+    ds = focitools.read_nemo(['EXP1'], [slice(None)], str(esm_dir), store_dir=store_dir)[0]
+
+    for v in ['nav_lon', 'nav_lat', 'time_centered', 'sosstsst']:
+        assert ds[v].equals(ref[v]), v
+    assert isinstance(ds['time'].values[0], cftime.datetime)
@@ -0,0 +1,51 @@
+import numpy as np
+import pandas as pd
+import xarray as xr
+import pytest
+
+from focitools.climate_indices import compute_nino_index, compute_enso_indices
+
+
+def _sst(lon):
+    """
+    Monthly SST with an ENSO-like signal in the tropical Pacific and a
+    different signal elsewhere, so points outside the region change the index
+    """
+
+    time = pd.date_range('2000-01-01', periods=120, freq='MS')
+    lat = np.arange(-20, 21, 2.0)
+    rng = np.random.default_rng(0)
+    signal = np.sin(2 * np.pi * np.arange(120) / 45.)
+    other = rng.standard_normal(120)
+
+    lon360 = lon % 360
+    pacific = (lon360 >= 160) & (lon360 <= 280)
+    data = np.where(pacific[None, None, :], signal[:, None, None], other[:, None, None])
+    data = data * np.ones((1, lat.size, 1))
+
+    return xr.DataArray(data, dims=('time', 'lat', 'lon'),
+                        coords={'time': time, 'lat': lat, 'lon': lon})
+
+
+@pytest.mark.parametrize('index', ['NINO3.4', 'NINO4'])
+def test_nino_index_same_on_both_longitude_conventions(index):
+    nino_360, en_360, ln_360 = compute_nino_index(_sst(np.arange(0, 360, 5.0)), index=index)
+    nino_180, en_180, ln_180 = compute_nino_index(_sst(np.arange(-180, 180, 5.0)), index=index)
+
+    np.testing.assert_allclose(nino_180.values, nino_360.values, atol=1e-10)
+    np.testing.assert_array_equal(en_180[0], en_360[0])
+    assert len(en_360[0]) > 0
+
+
+def test_enso_indices_use_areacello():
+    sst = _sst(np.arange(0, 360, 5.0))
+    coslat = np.cos(np.deg2rad(sst['lat'])) * xr.ones_like(sst['lon'])
+
+    ref = compute_enso_indices(sst, indices=['NINO3.4'])
+    ds = compute_enso_indices(sst, indices=['NINO3.4'], areacello=1e10 * coslat)
+    np.testing.assert_allclose(ds['NINO3.4'].values, ref['NINO3.4'].values)
+
+    # points with no area are not counted, so changing them does not change the index
+    north = xr.where(sst['lat'] > 0, coslat, 0)
+    ds = compute_enso_indices(sst.where(sst['lat'] > 0, 0), indices=['NINO3.4'], areacello=north)
+    np.testing.assert_allclose(ds['NINO3.4'].values, ref['NINO3.4'].values)
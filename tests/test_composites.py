@@ -0,0 +1,35 @@
+import numpy as np
+import pandas as pd
+import pytest
+import xarray as xr
+from focitools.composites import compute_composites
+
+
+def _data():
+    time = pd.date_range('2000-01-01', periods=6, freq='MS')
+    return xr.DataArray(np.arange(6.), dims='time', coords={'time': time}).chunk({'time': 2})
+
+
+def test_classes_matched_by_time():
+    data = _data()
+    classes = xr.DataArray(['a', 'b', 'a', 'b', 'a', 'b'], dims='time', coords={'time': data['time']})
+
+    # reversed, and one year longer than data
+    time = pd.date_range('1999-01-01', periods=18, freq='MS')
+    longer = xr.DataArray(['c'] * 12 + ['a', 'b'] * 3, dims='time', coords={'time': time})
+
+    ref = compute_composites(data, classes)
+    comp = compute_composites(data, longer.isel(time=slice(None, None, -1)), labels=['a', 'b'])
+
+    np.testing.assert_array_equal(comp['mean'].values, ref['mean'].values)
+    np.testing.assert_array_equal(comp['mean'].values, [2., 3.])
+
+
+def test_classes_must_cover_data():
+    data = _data()
+    classes = xr.DataArray(['a', 'b', 'a'], dims='time', coords={'time': data['time'][:3]})
+
+    with pytest.raises(ValueError):
+        compute_composites(data, classes)
+    with pytest.raises(ValueError):
+        compute_composites(data, ['a', 'b', 'a'])
@@ -0,0 +1,29 @@
+from concurrent.futures import ThreadPoolExecutor
+from focitools import functions
+from conftest import write_nemo_files
+
+
+def test_cache_from_threads(tmp_path, monkeypatch):
+    """
+    Opening files from several threads (as read_nemo_agrif does) must keep
+    the cache consistent and within dataset_cache_size
+    """
+
+    esm_dir = tmp_path / 'esm'
+    prefixes = ['', '1_', '2_', '3_']
+    for prefix in prefixes:
+        write_nemo_files(esm_dir, prefix=prefix)
+    patterns = [str(esm_dir / 'EXP1' / 'outdata' / 'nemo' / (p + 'EXP1*grid_T.nc')) for p in prefixes]
+
+    monkeypatch.setattr(functions, 'dataset_cache_size', 2)
+    functions.clear_dataset_cache()
+
+    def _open(i):
+        return functions.open_multifile_dataset(patterns[i % len(patterns)], chunks={'time_counter': 12})
+
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        datasets = list(pool.map(_open, range(32)))
+
+    assert all(ds.sizes['time_counter'] == 24 for ds in datasets)
+    assert len(functions._dataset_cache) <= 2
+    functions.clear_dataset_cache()
@@ -0,0 +1,70 @@
+import numpy as np
+import pandas as pd
+import pytest
+import xarray as xr
+from focitools.eof import compute_eofs
+
+
+def _field(nt, ny=30, nx=40, chunk=24):
+    """
+    Monthly field with two modes and noise, chunked in time
+    """
+
+    rng = np.random.default_rng(0)
+    time = pd.date_range('2000-01-01', periods=nt, freq='MS')
+    lat = np.linspace(-60, 60, ny)
+    lon = np.linspace(0, 351, nx)
+    p1 = np.cos(np.deg2rad(lat))[:, None] * np.sin(np.deg2rad(lon))[None, :]
+    p2 = np.sin(np.deg2rad(2 * lat))[:, None] * np.ones(nx)[None, :]
+    data = (3 * rng.standard_normal(nt)[:, None, None] * p1 +
+            rng.standard_normal(nt)[:, None, None] * p2 +
+            0.1 * rng.standard_normal((nt, ny, nx)))
+    return xr.DataArray(data, dims=('time', 'lat', 'lon'),
+                        coords={'time': time, 'lat': lat, 'lon': lon}).chunk({'time': chunk})
+
+
+def _peak_cache(func):
+    """
+    Largest total size (bytes) of task results held by dask at the same time
+    """
+
+    import dask
+    from dask.diagnostics import CacheProfiler
+
+    with dask.config.set(scheduler='synchronous'), CacheProfiler(metric=lambda x: getattr(x, 'nbytes', 0)) as prof:
+        func()
+
+    events = sorted([(r.cache_time, r.metric) for r in prof.results] +
+                    [(r.free_time, -r.metric) for r in prof.results])
+    return max(np.cumsum([m for t, m in events]))
+
+
+def test_eofs_match_numpy_svd():
+    data = _field(240)
+    ds = compute_eofs(data, neofs=2, anomalies='mean')
+
+    anom = (data - data.mean('time')) * np.sqrt(np.cos(np.deg2rad(data['lat'])) /
+                                                np.cos(np.deg2rad(data['lat'])).mean())
+    X = anom.values.reshape(240, -1)
+    u, s, vt = np.linalg.svd(X, full_matrices=False)
+
+    np.testing.assert_allclose(ds['explained_variance'].values, s[:2]**2 / np.sum(s**2), rtol=1e-6)
+    for m in range(2):
+        pattern = ds['eofs'].isel(mode=m).values.ravel()
+        assert abs(abs(np.dot(pattern, vt[m])) - 1) < 1e-6
+
+
+def test_eof_memory_does_not_grow_with_record():
+    """
+    Peak memory is set by the chunk size, not by the number of time steps.
+    Only the tree of partial sums of X.T @ Q grows, with the log of the number of chunks
+    """
+
+    short = _field(120)
+    long = _field(960)
+
+    peak_short = _peak_cache(lambda: compute_eofs(short, neofs=2))
+    peak_long = _peak_cache(lambda: compute_eofs(long, neofs=2))
+
+    assert peak_long < 2 * peak_short
+    assert peak_long < 0.2 * long.nbytes
@@ -0,0 +1,38 @@
+import numpy as np
+import pytest
+import xarray as xr
+from focitools import graph_checks
+from focitools.area_averages_and_integrals import area_mean_nemo
+
+
+def _data():
+    return xr.DataArray(np.ones((120, 20, 30)), dims=('time', 'y', 'x')).chunk({'time': 12})
+
+
+def test_estimate_tasks_without_building_graph(monkeypatch):
+    data = (_data() * 2 + 1).mean(('x', 'y'))
+    ntasks = len(data.__dask_graph__())
+
+    def _fail(*args):
+        raise AssertionError('graph was built')
+    monkeypatch.setattr(xr.DataArray, '__dask_graph__', _fail)
+
+    estimate = graph_checks.estimate_cost(data, threads=1)
+    assert 0.5 * ntasks <= estimate['tasks'] <= 2 * ntasks
+
+
+def test_preflight_is_opt_in():
+    data = _data()
+    mask = xr.DataArray(np.ones((20, 30)), dims=('y', 'x'))
+
+    # off by default, so diagnostics do not check or rechunk
+    graph_checks.enable_preflight(False)
+    assert graph_checks.maybe_preflight(data, max_memory=1) is data
+    area_mean_nemo(data, mask, mask)
+
+    graph_checks.enable_preflight(True)
+    try:
+        with pytest.raises(MemoryError):
+            graph_checks.maybe_preflight(data, max_memory=1)
+    finally:
+        graph_checks.enable_preflight(False)
@@ -0,0 +1,84 @@
+import numpy as np
+import pytest
+import xarray as xr
+from focitools.area_averages_and_integrals import area_mean, area_mean_nemo, seaice_areas
+from focitools.area_averages_and_integrals import _pairwise_sum, _lowprec_sum
+
+
+def _rel_error(ref, low):
+    return float(abs(low.astype(np.float64) - ref).max() / abs(ref).max())
+
+
+@pytest.fixture
+def field():
+    """
+    float32 field, as e.g. from read_nemo
+    """
+
+    rng = np.random.default_rng(0)
+    data = (280 + 20 * rng.random((4, 180, 360))).astype(np.float32)
+    return data
+
+
+def test_area_mean_float32(field):
+    data = xr.DataArray(field, dims=('time', 'lat', 'lon'),
+                        coords={'lat': np.linspace(-89.5, 89.5, 180),
+                                'lon': np.arange(0.5, 360, 1.0)}).chunk({'time': 1, 'lat': 60})
+
+    ref = area_mean(data.astype(np.float64)).compute()
+    low = area_mean(data, dtype=np.float32).compute()
+
+    assert low.dtype == np.float32
+    assert _rel_error(ref, low) < 1e-6
+
+
+def test_area_mean_nemo_float32(field):
+    data = xr.DataArray(field, dims=('time', 'y', 'x')).chunk({'time': 1, 'y': 60})
+    rng = np.random.default_rng(1)
+    mask = xr.DataArray((rng.random(field.shape[1:]) > 0.3).astype(np.int8), dims=('y', 'x'))
+    cell_area = xr.DataArray((1e9 * (1 + rng.random(field.shape[1:]))).astype(np.float32),
+                             dims=('y', 'x'))
+
+    ref = area_mean_nemo(data.astype(np.float64), mask, cell_area.astype(np.float64)).compute()
+    low = area_mean_nemo(data, mask, cell_area, dtype=np.float32).compute()
+
+    assert _rel_error(ref, low) < 1e-6
+
+
+def test_seaice_areas_float32():
+    rng = np.random.default_rng(2)
+    ny, nx = 180, 360
+    sic = rng.random((4, ny, nx)).astype(np.float32)
+    lat = np.repeat(np.linspace(-89.5, 89.5, ny)[:, None], nx, axis=1)
+    ds = xr.Dataset({'ileadfra': (('time', 'y', 'x'), sic)},
+                    coords={'nav_lat': (('y', 'x'), lat)}).chunk({'time': 1, 'y': 60})
+    areacello = xr.DataArray((1e9 * (1 + rng.random((ny, nx)))).astype(np.float32), dims=('y', 'x'))
+    lsm = xr.DataArray(np.ones((ny, nx)), dims=('y', 'x'))
+
+    ref = seaice_areas(ds.astype(np.float64), areacello.astype(np.float64), lsm).compute()
+    low = seaice_areas(ds, areacello, lsm, dtype=np.float32).compute()
+
+    for v in ref.data_vars:
+        assert _rel_error(ref[v], low[v]) < 1e-6
+
+
+def test_pairwise_sum_over_strided_axis():
+    """
+    numpy adds along a non-contiguous axis one value at a time,
+    so the error of a long float32 sum grows with its length
+    """
+
+    x = np.random.default_rng(3).random((2**21, 4)).astype(np.float32)
+    ref = x.astype(np.float64).sum(axis=0)
+
+    assert _rel_error(ref, np.sum(x, axis=0, dtype=np.float32)) > 1e-5
+    assert _rel_error(ref, _pairwise_sum(x, 0)) < 1e-6
+
+
+def test_lowprec_sum_over_leading_dims():
+    x = np.random.default_rng(4).random((1024, 1024, 2)).astype(np.float32)
+    ref = x.astype(np.float64).sum(axis=(0, 1))
+    data = xr.DataArray(x, dims=('y', 'x', 'time')).chunk({'y': 512})
+
+    assert _rel_error(ref, np.sum(x, axis=(0, 1), dtype=np.float32)) > 1e-6
+    assert _rel_error(ref, _lowprec_sum(data, ('y', 'x')).values) < 1e-7
@@ -0,0 +1,40 @@
+import numpy as np
+import scipy.sparse as sparse
+import xarray as xr
+from focitools.regrid import regrid_nemo
+
+
+def _mesh(ny=20, nx=30):
+    lon, lat = np.meshgrid(np.linspace(-178, 170, nx), np.linspace(-70, 70, ny))
+    lonf, latf = lon + 6, lat + 3.5
+    return xr.Dataset({'glamt': (('y', 'x'), lon), 'gphit': (('y', 'x'), lat),
+                       'glamf': (('y', 'x'), lonf), 'gphif': (('y', 'x'), latf)})
+
+
+def test_regrid_chunked_matches_numpy(tmp_path):
+    ds_mesh = _mesh()
+    rng = np.random.default_rng(0)
+    data = xr.DataArray(rng.random((12, 20, 30)), dims=('time', 'y', 'x'))
+    lon, lat = np.arange(-170, 170, 10.), np.arange(-60, 61, 10.)
+
+    ref = regrid_nemo(data, ds_mesh, lon, lat, weights_dir=str(tmp_path))
+    out = regrid_nemo(data.chunk({'time': 2, 'y': 10}), ds_mesh, lon, lat, weights_dir=str(tmp_path))
+
+    assert out.dims == ('time', 'lat', 'lon')
+    np.testing.assert_allclose(out.values, ref.values)
+
+
+def test_weights_in_graph_once(tmp_path):
+    ds_mesh = _mesh()
+    data = xr.DataArray(np.ones((12, 20, 30)), dims=('time', 'y', 'x')).chunk({'time': 1})
+    lon, lat = np.arange(-170, 170, 10.), np.arange(-60, 61, 10.)
+
+    out = regrid_nemo(data, ds_mesh, lon, lat, weights_dir=str(tmp_path))
+
+    graph = dict(out.data.__dask_graph__())
+    nweights = 0
+    for task in graph.values():
+        value = getattr(task, 'value', task)
+        if sparse.issparse(value):
+            nweights += 1
+    assert nweights == 1
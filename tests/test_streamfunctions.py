@@ -0,0 +1,43 @@
+import numpy as np
+import xarray as xr
+from focitools import eos
+from focitools.streamfunctions import compute_moc_sigma
+
+
+def _moc_inputs(nt=4, nz=5, ny=6, nx=7):
+    rng = np.random.default_rng(1)
+    temp = 20 - 3 * np.arange(nz)[None, :, None, None] + rng.random((nt, nz, ny, nx))
+    salt = 35 + rng.random((nt, nz, ny, nx))
+    vel = rng.standard_normal((nt, nz, ny, nx))
+
+    ds_t = xr.Dataset({'votemper': (('time', 'deptht', 'y', 'x'), temp),
+                       'vosaline': (('time', 'deptht', 'y', 'x'), salt)})
+    ds_v = xr.Dataset({'vomecrty': (('time', 'depthv', 'y', 'x'), vel)})
+    ds_mesh = xr.Dataset({'e1v': (('y', 'x'), np.full((ny, nx), 1e4)),
+                          'vmask': (('depthv', 'y', 'x'), np.ones((nz, ny, nx))),
+                          'dzv': (('depthv', 'y', 'x'), np.full((nz, ny, nx), 100.))})
+
+    return ds_t, ds_v, ds_mesh
+
+
+def test_moc_sigma_matches_direct_binning():
+    ds_t, ds_v, ds_mesh = _moc_inputs()
+    bins = np.arange(20, 38, 0.5)
+
+    moc = compute_moc_sigma(ds_t.chunk({'time': 3}), ds_v.chunk({'time': 3}), ds_mesh,
+                            sigma_bins=bins).compute()
+
+    # direct loop over points
+    rho = eos.sigma2(ds_t['votemper'].values, ds_t['vosaline'].values)
+    rho_v = 0.5 * (rho[:, :, :-1, :] + rho[:, :, 1:, :])
+    trp = ds_v['vomecrty'].values * 1e6
+    nt, nz, ny, nx = trp.shape
+    expected = np.zeros((nt, ny, len(bins) + 1))
+    for n in range(nt):
+        for k in range(nz):
+            for j in range(ny - 1):
+                for i in range(nx):
+                    expected[n, j, np.searchsorted(bins, rho_v[n, k, j, i])] += trp[n, k, j, i]
+    expected = np.cumsum(expected, axis=-1) * 1e-6
+
+    np.testing.assert_allclose(moc.transpose('time', 'y', 'sigma').values[:, :-1], expected[:, :-1])
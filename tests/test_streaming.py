@@ -0,0 +1,39 @@
+import threading
+import numpy as np
+import xarray as xr
+from focitools import streaming
+
+
+def test_blocks_in_memory_within_max_bytes(monkeypatch):
+    """
+    Blocks being read, blocks read ahead and the blocks held by the caller
+    (the current one and, until the next is returned, the previous one)
+    must fit in max_bytes
+    """
+
+    ds = xr.Dataset({'a': (('time', 'x'), np.zeros((20, 1000)))}).chunk({'time': 2})
+    block_bytes = ds.isel(time=slice(0, 2)).nbytes
+    max_bytes = 4 * block_bytes
+
+    lock = threading.Lock()
+    state = {'started': 0, 'yielded': 0, 'peak': 0}
+    load_block = streaming._load_block
+
+    def _load_block(*args):
+        with lock:
+            state['started'] += 1
+            # the caller has let go of all yielded blocks but the last one
+            live = state['started'] - max(state['yielded'] - 1, 0)
+            state['peak'] = max(state['peak'], live)
+        return load_block(*args)
+
+    monkeypatch.setattr(streaming, '_load_block', _load_block)
+
+    total = 0
+    for block in streaming.iter_time_blocks(ds, prefetch=8, max_bytes=max_bytes):
+        with lock:
+            state['yielded'] += 1
+        total += block.sizes['time']
+
+    assert total == 20
+    assert state['peak'] <= 4
@@ -0,0 +1,26 @@
+import numpy as np
+import xarray as xr
+from focitools.area_averages_and_integrals import volume_integral_nemo
+
+
+def test_static_and_vvl_paths_agree():
+    nt, nz, ny, nx = 3, 4, 5, 6
+    rng = np.random.default_rng(0)
+    dz = xr.DataArray([10., 20., 30., 40.], dims='deptht')
+    depth_top = xr.DataArray([0., 10., 30., 60.], dims='deptht')
+    mask = xr.DataArray((rng.random((nz, ny, nx)) > 0.2).astype(np.int8), dims=('deptht', 'y', 'x'))
+    volcello = 1e6 * dz * xr.ones_like(mask, dtype=np.float64)
+    depth0 = (dz * mask).sum('deptht')
+    data = xr.DataArray(rng.random((nt, nz, ny, nx)), dims=('time', 'deptht', 'y', 'x')).chunk({'time': 1})
+    ssh = xr.zeros_like(data.isel(deptht=0, drop=True))
+
+    layers = {'upper': (0, 30), 'full': (0, None)}
+    basins = {'a': xr.DataArray(np.arange(nx) < 3, dims='x') * xr.ones_like(depth0),
+              'b': xr.DataArray(np.arange(nx) >= 3, dims='x') * xr.ones_like(depth0)}
+
+    static = volume_integral_nemo(data, mask, volcello, depth_top, dz, layers=layers, basins=basins)
+    vvl = volume_integral_nemo(data, mask, volcello, depth_top, dz, layers=layers, basins=basins,
+                               ssh=ssh, depth0=depth0)
+
+    assert static.dims == vvl.dims == ('time', 'basin', 'layer')
+    np.testing.assert_allclose(vvl.values, static.values)